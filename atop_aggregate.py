@@ -0,0 +1,384 @@
+'''Per key statistics of atop records computed in bounded memory.
+
+Records are aggregated chunk by chunk (column batches from `iterate_atop_batches`,
+dataframe chunks read from the sqlite store, ...) into state that only grows with the number
+of distinct keys: count, sum, min and max of every field and a log bucketed histogram for
+approximate quantiles (relative error of at most `accuracy`). Aggregates of different chunks,
+files or worker processes are merged with `Aggregate.merge`.
+
+Examples:
+
+# cpu consumption per process name over a month of logs, 4 files at a time
+agg = aggregate_atop_logs(list_atop_logs()[-30:], 'PRC', keys=['name'],
+                          fields=['cpu_usr', 'cpu_sys'], workers=4)
+agg.result(quantiles=(.5, .95, .99))
+
+# the same from a sqlite database made by `to_sqlite`
+agg = aggregate_sqlite(sqlite3.connect('atop.db'), 'PRC', keys=['name'], fields=['cpu_usr', 'cpu_sys'])
+
+# which processes dominated cpu, memory, disk and network in each hour of a month of logs
+records = iterate_atop_records(list_atop_logs()[-30:], ['PRC', 'PRM', 'PRD', 'PRN'])
+for window_start, top in top_processes(records, window=3600, k=5):
+    print(window_start, top['cpu'])
+'''
+import math
+import heapq
+from itertools import count
+
+
+__all__ = [
+    'Aggregate',
+    'aggregate_batches',
+    'aggregate_sqlite',
+    'aggregate_atop_logs',
+    'SpaceSaving',
+    'TOP_METRICS',
+    'top_processes',
+]
+
+# metric -> (record type, fields summed into the metric, 'sum' over the window or 'mean' per sample)
+TOP_METRICS = {
+    'cpu': ('PRC', ('cpu_usr', 'cpu_sys'), 'sum'),
+    'mem': ('PRM', ('mem_res_size',), 'mean'),
+    'disk_read': ('PRD', ('reads_sectors_cum',), 'sum'),
+    'disk_write': ('PRD', ('writes_sectors_cum',), 'sum'),
+    'net': ('PRN', ('tcp_snt_cum', 'tcp_rcv_cum', 'udp_snt_cum', 'udp_rcv_cum'), 'sum'),
+}
+
+
+# histogram bucket of zero (and of values too close to it to be told apart)
+_ZERO_BUCKET = 0
+# bucket indexes are shifted by this so that negative values get negative buckets
+_BUCKET_OFFSET = 1 << 20
+_MIN_VALUE = 1e-9
+
+
+class Aggregate:
+    '''Mergeable per key statistics of numeric fields.
+
+    :param keys: columns to group by (e.g. name, TGID or a process tree column)
+    :param fields: numeric columns to aggregate
+    :param accuracy: relative error of the approximate quantiles
+    '''
+
+    def __init__(self, keys, fields, accuracy=0.01):
+        self.keys = list(keys)
+        self.fields = list(fields)
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # dataframe indexed by keys with <field>_count/sum/min/max columns
+        self._stats = None
+        # field -> series of counts indexed by (*keys, bucket)
+        self._sketches = {}
+
+    def update(self, columns):
+        '''Add a chunk of records.
+
+        :param columns: dataframe or dict of column -> numpy array, e.g. columns of `iterate_atop_batches`
+        :returns: self
+        '''
+
+        import pandas as pd
+
+        chunk = pd.DataFrame({name: columns[name] for name in (*self.keys, *self.fields)}, copy=False)
+        if not len(chunk):
+            return self
+
+        grouped = chunk.groupby(self.keys, sort=False)
+        stats = grouped[self.fields].agg(['count', 'sum', 'min', 'max'])
+        stats.columns = [f'{field}_{stat}' for field, stat in stats.columns]
+        self._merge_stats(stats)
+
+        for field in self.fields:
+            values = chunk[field].to_numpy(dtype='float64')
+            valid = ~pd.isna(values)
+            buckets = pd.Series(self._buckets(values[valid]), name='bucket')
+            keys = [chunk[k].to_numpy()[valid] for k in self.keys]
+            counts = buckets.groupby([*keys, buckets], sort=False).size()
+            counts.index.names = [*self.keys, 'bucket']
+            self._merge_sketch(field, counts)
+
+        return self
+
+    def merge(self, other):
+        '''Add the state of another aggregate of the same keys and fields (e.g. from a worker process).
+
+        :returns: self
+        '''
+
+        if (other.keys, other.fields, other.accuracy) != (self.keys, self.fields, self.accuracy):
+            raise ValueError('only aggregates of the same keys, fields and accuracy can be merged')
+
+        if other._stats is not None:
+            self._merge_stats(other._stats)
+        for field, counts in other._sketches.items():
+            self._merge_sketch(field, counts)
+        return self
+
+    def result(self, quantiles=(.5, .95)):
+        '''Compute the statistics.
+
+        :returns: dataframe indexed by keys with <field>_count, <field>_sum, <field>_mean, <field>_min,
+                  <field>_max and <field>_p<quantile * 100> columns
+        '''
+
+        import pandas as pd
+
+        if self._stats is None:
+            return pd.DataFrame()
+
+        stats = self._stats.sort_index()
+        columns = {}
+        for field in self.fields:
+            count = stats[f'{field}_count']
+            columns[f'{field}_count'] = count.astype('int64')
+            columns[f'{field}_sum'] = stats[f'{field}_sum']
+            columns[f'{field}_mean'] = stats[f'{field}_sum'] / count.where(count > 0)
+            columns[f'{field}_min'] = stats[f'{field}_min']
+            columns[f'{field}_max'] = stats[f'{field}_max']
+            for q in quantiles:
+                estimate = self._quantile(field, q).reindex(stats.index)
+                # estimates never fall outside of the seen values
+                columns[f'{field}_p{q * 100:g}'] = estimate.clip(stats[f'{field}_min'], stats[f'{field}_max'])
+
+        return pd.DataFrame(columns)
+
+    def _merge_stats(self, stats):
+        import pandas as pd
+
+        if self._stats is None:
+            self._stats = stats
+            return
+
+        combined = pd.concat([self._stats, stats]).groupby(level=self.keys, sort=False)
+        how = {c: c.rsplit('_', 1)[1] for c in stats.columns}
+        self._stats = combined.agg({c: 'sum' if h in ('count', 'sum') else h for c, h in how.items()})
+
+    def _merge_sketch(self, field, counts):
+        current = self._sketches.get(field)
+        self._sketches[field] = counts if current is None else current.add(counts, fill_value=0)
+
+    def _buckets(self, values):
+        import numpy as np
+
+        magnitude = np.abs(values)
+        nonzero = magnitude >= _MIN_VALUE
+        index = np.ceil(np.log(np.where(nonzero, magnitude, 1)) / self._log_gamma).astype('int64')
+        return np.where(nonzero, np.sign(values).astype('int64') * (index + _BUCKET_OFFSET), _ZERO_BUCKET)
+
+    def _values(self, buckets):
+        import numpy as np
+
+        index = np.abs(buckets) - _BUCKET_OFFSET
+        # middle of the bucket in terms of relative error
+        values = 2 * self._gamma ** index.astype('float64') / (self._gamma + 1)
+        return np.where(buckets == _ZERO_BUCKET, 0.0, np.sign(buckets) * values)
+
+    def _quantile(self, field, q):
+        import pandas as pd
+
+        counts = self._sketches[field].sort_index()
+        levels = list(range(len(self.keys)))
+        total = counts.groupby(level=levels).transform('sum')
+        cumulative = counts.groupby(level=levels).cumsum()
+
+        # first bucket whose cumulative count passes the rank of the quantile
+        reached = counts[cumulative > q * (total - 1)]
+        first = reached.groupby(level=levels).head(1)
+
+        buckets = first.index.get_level_values('bucket').to_numpy()
+        index = first.index.droplevel('bucket')
+        return pd.Series(self._values(buckets), index=index)
+
+
+def aggregate_batches(batches, record_type, keys, fields, accuracy=0.01):
+    '''Aggregate records of a single type from batches yielded by `iterate_atop_batches`.
+
+    :returns: `Aggregate`
+    '''
+
+    aggregate = Aggregate(keys, fields, accuracy)
+    for type_, columns in batches:
+        if type_ == record_type:
+            aggregate.update(columns)
+    return aggregate
+
+
+def aggregate_sqlite(conn, table, keys, fields, accuracy=0.01, where=None, params=(), chunksize=100000):
+    '''Aggregate a table of a sqlite database made by `to_sqlite` (or its variants) chunk by chunk.
+
+    :param where: optional SQL condition to select rows with (e.g. 'epoch >= ?' with `params`)
+    :returns: `Aggregate`
+    '''
+
+    import pandas as pd
+
+    aggregate = Aggregate(keys, fields, accuracy)
+    query = f'SELECT {", ".join([*keys, *fields])} FROM {table}'
+    if where:
+        query += f' WHERE {where}'
+    for chunk in pd.read_sql(query, conn, params=params, chunksize=chunksize):
+        aggregate.update(chunk)
+    return aggregate
+
+
+def aggregate_atop_logs(files, record_type, keys, fields, accuracy=0.01, workers=None, **reader_kw):
+    '''Aggregate records of a single type read from atop logs, each file by its own worker process.
+
+    :param reader_kw: passed to `iterate_atop_batches` (binary, backend, time_range, pids, names ...)
+    :returns: `Aggregate`
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    args = [(path, record_type, keys, fields, accuracy, reader_kw) for path in files]
+
+    aggregate = Aggregate(keys, fields, accuracy)
+    if workers is None or workers <= 1:
+        for a in args:
+            aggregate.merge(_aggregate_file(a))
+        return aggregate
+
+    with ProcessPoolExecutor(workers) as executor:
+        for partial in executor.map(_aggregate_file, args):
+            aggregate.merge(partial)
+    return aggregate
+
+
+def _aggregate_file(args):
+    from atop_reader import GENERIC_FIELDS, iterate_atop_batches
+
+    path, record_type, keys, fields, accuracy, reader_kw = args
+    # only decode the needed fields, generic ones are always there
+    columns = {record_type: [c for c in (*keys, *fields) if c not in GENERIC_FIELDS]}
+    label = {'CPU_N': 'cpu', 'NET_IF': 'NET'}.get(record_type, record_type)
+    batches = iterate_atop_batches([path], [label], columns=columns, **reader_kw)
+    return aggregate_batches(batches, record_type, keys, fields, accuracy)
+
+
+class SpaceSaving:
+    '''Approximate heaviest keys of a weighted stream in fixed memory (the space-saving algorithm).
+
+    At most `capacity` keys are counted. A new key takes over the smallest counter when all are taken,
+    so every count overestimates the true sum of weights of its key by at most its error.
+    Keys with a true sum above total / capacity are guaranteed to be counted.
+
+    :param capacity: number of counters
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # key -> [count, error]
+        self.counters = {}
+        # (count, seq, key) of every counted key, entries of counts updated since are fixed when popped
+        self._heap = []
+        self._seq = count()
+
+    def update(self, key, weight=1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            return
+
+        error = 0
+        if len(self.counters) >= self.capacity:
+            error, evicted = self._pop_smallest()
+            del self.counters[evicted]
+
+        self.counters[key] = [error + weight, error]
+        heapq.heappush(self._heap, (error + weight, next(self._seq), key))
+
+    def top(self, k=None):
+        '''Heaviest keys.
+
+        :returns: list of (key, count, error) ordered by count, the true sum of a key is within
+                  [count - error, count]
+        '''
+
+        ranked = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, c, e) for key, (c, e) in ranked[:k]]
+
+    def _pop_smallest(self):
+        while True:
+            c, _, key = heapq.heappop(self._heap)
+            current = self.counters[key][0]
+            if current == c:
+                return c, key
+            heapq.heappush(self._heap, (current, next(self._seq), key))
+
+
+def top_processes(records, window=3600, k=10, metrics=None, key='name', capacity=None, schema='default'):
+    '''Approximate top `k` processes of every time window for each metric, in fixed memory.
+
+    Per thread records are skipped (their process record already includes them).
+    A window is summarized as soon as a record of a later (or earlier) window arrives,
+    so records are expected in time order as read by `iterate_atop_records`.
+
+    :param records: iterator returned by `iterate_atop_records` (with the types of `metrics`)
+    :param window: window length in seconds, windows are aligned to multiples of it
+    :param metrics: names from `TOP_METRICS` or a dict in the same format, all of them by default
+    :param key: field to rank by (name, TGID, ...) or a function of the record tuple (e.g. a process tree)
+    :param capacity: counters per metric and window, `k` * 10 by default
+    :param schema: schema the records were read with
+    :returns: an iterator that yields (window start epoch, {metric: [(key, value, error), ...]}),
+              'mean' metrics are divided by the number of samples in the window
+    '''
+
+    from atop_reader import ATOP_SCHEMA, GENERIC_FIELDS, parse_atop_schema
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+    if metrics is None:
+        metrics = TOP_METRICS
+    elif not isinstance(metrics, dict):
+        metrics = {m: TOP_METRICS[m] for m in metrics}
+    capacity = capacity or k * 10
+
+    # record type -> [(metric, value positions)], positions of key and is_process
+    n = len(GENERIC_FIELDS)
+    by_type = {}
+    layouts = {}
+    for metric, (type_, fields, _) in metrics.items():
+        names = [f[0] for f in schema[type_]['fields']]
+        by_type.setdefault(type_, []).append((metric, [n + names.index(f) for f in fields]))
+        key_position = None if callable(key) else n + names.index(key)
+        is_process = n + names.index('is_process') if 'is_process' in names else None
+        layouts[type_] = key_position, is_process
+
+    def summary():
+        samples = len(sample_ns) or 1
+        top = {}
+        for metric, sketch in sketches.items():
+            scale = samples if metrics[metric][2] == 'mean' else 1
+            top[metric] = [(key_, c / scale, e / scale) for key_, c, e in sketch.top(k)]
+        return current, top
+
+    current = None
+    sketches = {}
+    sample_ns = set()
+
+    for record in records:
+        type_metrics = by_type.get(record[0])
+        if type_metrics is None:
+            continue
+
+        start = int(record[1]) // window * window
+        if start != current:
+            if current is not None:
+                yield summary()
+            current = start
+            sketches = {metric: SpaceSaving(capacity) for metric in metrics}
+            sample_ns = set()
+        sample_ns.add(record[3])
+
+        key_position, is_process = layouts[record[0]]
+        if is_process is not None and record[is_process] in (False, 'n'):
+            continue
+
+        record_key = key(record) if key_position is None else record[key_position]
+        for metric, positions in type_metrics:
+            sketches[metric].update(record_key, sum(float(record[i]) for i in positions))
+
+    if current is not None:
+        yield summary()
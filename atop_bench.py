@@ -0,0 +1,517 @@
+'''Benchmarks of the atop reader and writers over a synthetic corpus.
+
+The corpus is a directory of daily logs holding generated `atop -P ALL` text
+(see `generate_atop_lines`) together with a fake `atop` executable replaying it,
+so the reader can be measured without real logs or atop installed.
+
+Examples:
+
+# 3 days of 10 minute samples of a machine with 300 tasks
+python atop_bench.py corpus bench_corpus --days 3 --processes 300
+
+# run all stages and store the results as a baseline
+python atop_bench.py run bench_corpus --save before
+
+# compare a later run against it
+python atop_bench.py run bench_corpus --compare before
+
+# the corpus can be read like any other log directory
+files = list_atop_logs('bench_corpus')
+frames = to_pandas(iterate_atop_records(files, binary='bench_corpus/atop'))
+'''
+import os
+import sys
+import glob
+import json
+import time
+import random
+from datetime import datetime
+
+from atop_schema import ATOP_SCHEMA
+
+
+__all__ = [
+    'BENCH_STAGES',
+    'generate_atop_lines',
+    'write_corpus',
+    'run_benchmarks',
+]
+
+
+# atop labels of record types that are renamed by the reader
+_LABELS = {'CPU_N': 'cpu', 'NET_IF': 'NET'}
+
+_PROCESS_TYPES = ('PRG', 'PRC', 'PRM', 'PRD', 'PRN')
+
+_TICKS = ('cpu_sys', 'cpu_usr', 'cpu_niced', 'cpu_idle', 'cpu_wait',
+          'cpu_irq', 'cpu_softirq', 'cpu_steal', 'cpu_guest')
+
+_NAMES = ('systemd', 'sshd', 'bash', 'python3', 'postgres', 'nginx', 'java', 'chrome',
+          'kworker/0:1', 'rsyslogd', 'cron', 'dockerd', 'containerd', 'node', 'redis-server')
+
+
+def generate_atop_lines(samples=144, start_epoch=1508882400, interval=600, processes=200,
+                        thread_ratio=0.5, cpus=4, disks=2, interfaces=2, reboots=(), churn=0.02,
+                        record_types=('ALL',), seed=0):
+    '''Generate `atop -P` output of a single log file, every record type of `ATOP_SCHEMA` is produced.
+
+    :param processes: number of tasks per sample (processes and their threads)
+    :param thread_ratio: fraction of tasks that are threads of another process
+    :param reboots: indexes of samples preceded by a machine reboot ('RESET')
+    :param churn: fraction of tasks replaced by new ones between samples
+    :returns: an iterator that yields lines (without line ends)
+    '''
+
+    from atop_reader import parse_atop_schema
+
+    schema = parse_atop_schema(ATOP_SCHEMA)
+    types = list(schema)
+    if 'ALL' not in record_types:
+        labels = set(record_types)
+        types = [t for t in types if _LABELS.get(t, t) in labels]
+
+    rnd = random.Random(seed)
+    hertz = 100
+
+    tasks = _Tasks(rnd, processes, thread_ratio)
+
+    yield 'RESET'
+
+    for n in range(samples):
+        epoch = start_epoch + n * interval
+        if n in reboots:
+            yield 'RESET'
+            tasks = _Tasks(rnd, processes, thread_ratio)
+        elif n:
+            yield 'SEP'
+            tasks.churn(churn)
+
+        date = time.strftime('%Y/%m/%d %H:%M:%S', time.localtime(epoch))
+        ctx = {'interval': interval, 'hertz': hertz, 'cpus': cpus}
+
+        for type_ in types:
+            head = f'{_LABELS.get(type_, type_)} localhost {epoch} {date} {interval}'
+            entry = schema[type_]
+            fields = [f[0] for f in entry['fields']]
+
+            if type_ in _PROCESS_TYPES:
+                for task in tasks.tasks:
+                    ctx['task'] = task
+                    yield f'{head} {_format_values(rnd, type_, fields, entry["types"], ctx)}'
+                continue
+
+            if type_ == 'CPU_N':
+                rows = range(cpus)
+            elif type_ in ('LVM', 'MDD', 'NFM'):
+                rows = range(1)
+            elif type_ == 'DSK':
+                rows = range(disks)
+            elif type_ == 'NET_IF':
+                rows = range(interfaces)
+            else:
+                rows = range(1)
+
+            for row in rows:
+                ctx['row'] = row
+                yield f'{head} {_format_values(rnd, type_, fields, entry["types"], ctx)}'
+
+
+class _Tasks:
+    'Set of tasks running on the generated machine.'
+
+    def __init__(self, rnd, count, thread_ratio):
+        self.rnd = rnd
+        self.thread_ratio = thread_ratio
+        self.next_tid = 1
+        self.tasks = []
+        for _ in range(count):
+            self.tasks.append(self._new_task())
+
+    def _new_task(self):
+        rnd = self.rnd
+        tid = self.next_tid
+        self.next_tid += 1
+
+        processes = [t for t in self.tasks if t['is_process']]
+        if processes and rnd.random() < self.thread_ratio:
+            # a thread of an existing process
+            parent = rnd.choice(processes)
+            return dict(parent, tid=tid, is_process=False)
+
+        name = rnd.choice(_NAMES)
+        ppid = rnd.choice(processes)['tid'] if processes else 0
+        return {'tid': tid, 'tgid': tid, 'ppid': ppid, 'name': name, 'is_process': True,
+                'cmd': f'/usr/bin/{name} --worker {tid}', 'uid': rnd.choice((0, 33, 1000)),
+                'start': 1508800000 + tid}
+
+    def churn(self, fraction):
+        for i in range(1, len(self.tasks)):
+            if self.rnd.random() < fraction:
+                self.tasks[i] = self._new_task()
+
+
+def _format_values(rnd, type_, fields, types, ctx):
+    'Format type specific values of one record.'
+
+    interval, hertz, cpus = ctx['interval'], ctx['hertz'], ctx['cpus']
+    task = ctx.get('task')
+    values = []
+    ticks = None
+
+    for name, typ in zip(fields, types):
+        if name in _TICKS and type_ in ('CPU', 'CPU_N'):
+            if ticks is None:
+                total = hertz * interval * (cpus if type_ == 'CPU' else 1)
+                weights = [rnd.random() ** 3 for _ in _TICKS]
+                weights[_TICKS.index('cpu_idle')] += 2
+                ticks = {t: int(total * w / sum(weights)) for t, w in zip(_TICKS, weights)}
+            values.append(ticks[name])
+        elif task is not None and name in ('TID', 'name', 'state', 'TGID', 'is_process', 'cmd', 'PPID'):
+            values.append({
+                'TID': task['tid'],
+                'name': f'({task["name"]})',
+                'state': 'S' if rnd.random() < .9 else 'R',
+                'TGID': task['tgid'],
+                'is_process': 'y' if task['is_process'] else 'n',
+                'cmd': f'({task["cmd"]})',
+                'PPID': task['ppid'],
+            }[name])
+        elif name in ('cpu_tot',):
+            values.append(hertz)
+        elif name in ('processors',):
+            values.append(cpus)
+        elif name == 'proc_n':
+            values.append(ctx['row'])
+        elif name == 'start_epoch':
+            values.append(task['start'])
+        elif name in ('uid_real', 'uid_effective', 'uid_saved', 'uid_fs',
+                      'gid_real', 'gid_effective', 'gid_saved', 'gid_fs'):
+            values.append(task['uid'])
+        elif name in ('VPID', 'CTID'):
+            # only set inside OpenVZ containers
+            values.append(0)
+        elif name == 'threads':
+            values.append(1 if not task['is_process'] else rnd.randint(1, 20))
+        elif name == 'ms_spent':
+            values.append(rnd.randint(0, interval * 1000 // 4))
+        elif name == 'page_size':
+            values.append(4096)
+        elif typ is str:
+            if name == 'NONE':
+                values.append('upper')
+            elif type_ == 'DSK':
+                values.append(f'sd{chr(ord("a") + ctx["row"])}')
+            elif type_ == 'NET_IF':
+                values.append(f'eth{ctx["row"]}')
+            elif name == 'CID':
+                values.append('-')
+            else:
+                values.append(f'{type_.lower()}{ctx.get("row", 0)}')
+        elif typ is bool:
+            values.append('y' if name in ('standard_io_stat', 'is_process') else 'n')
+        elif typ is float:
+            values.append(f'{rnd.random() * cpus:.2f}')
+        else:
+            values.append(rnd.randint(0, 100000))
+
+    return ' '.join(map(str, values))
+
+
+def write_corpus(directory, days=3, samples_per_day=144, processes=200, thread_ratio=0.5, cpus=4,
+                 disks=2, interfaces=2, reboots_per_day=0, churn=0.02, start_date='2017-10-20', seed=0):
+    '''Write a synthetic corpus: one `atop_YYYYMMDD` file per day and a fake `atop` executable.
+
+    The executable replays the text of a log as `atop -r <log> -P <types>` would print it,
+    pass it as `binary` to the reader, or the first log as `atop -P <types> <interval>` would take
+    its samples (see `replay`). Parameters are stored in `corpus.json`.
+    See `generate_atop_lines` for the rest of parameters.
+
+    :returns: list of written log files
+    '''
+
+    os.makedirs(directory, exist_ok=True)
+
+    rnd = random.Random(seed)
+    interval = 86400 // samples_per_day
+    start = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
+
+    files = []
+    lines = 0
+    for day in range(days):
+        epoch = start + day * 86400
+        path = os.path.join(directory, datetime.fromtimestamp(epoch).strftime('atop_%Y%m%d'))
+        reboots = sorted(rnd.sample(range(1, samples_per_day), reboots_per_day))
+        with open(path, 'w') as f:
+            for line in generate_atop_lines(samples_per_day, epoch, interval, processes, thread_ratio,
+                                            cpus, disks, interfaces, reboots, churn, seed=seed + day):
+                f.write(line + '\n')
+                lines += 1
+        files.append(path)
+
+    binary = os.path.join(directory, 'atop')
+    with open(binary, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" replay '
+                f'"{os.path.abspath(directory)}" "$@"\n')
+    os.chmod(binary, 0o755)
+
+    params = dict(days=days, samples_per_day=samples_per_day, processes=processes, thread_ratio=thread_ratio,
+                  cpus=cpus, disks=disks, interfaces=interfaces, reboots_per_day=reboots_per_day,
+                  churn=churn, start_date=start_date, seed=seed, lines=lines)
+    with open(os.path.join(directory, 'corpus.json'), 'w') as f:
+        json.dump(params, f, indent=1)
+
+    return files
+
+
+def replay(directory, args):
+    '''Print corpus logs as atop would, used by the fake atop executable of `directory`.
+
+    `atop -r <log> -P <types> [-b YYYYMMDDhhmm]` prints the log (from the given minute on),
+    `atop -P <types> <interval> [<samples>]` prints samples of the first log of the corpus
+    as they would be taken, one every `interval` seconds (can be fractional here).
+    '''
+
+    options = {}
+    positional = []
+    args = iter(args)
+    for arg in args:
+        if arg in ('-r', '-P', '-b'):
+            options[arg] = next(args)
+        else:
+            positional.append(arg)
+
+    labels = set(options['-P'].split(','))
+    if 'ALL' not in labels:
+        labels |= {'RESET', 'SEP'}
+
+    if '-r' in options:
+        path = options['-r']
+        interval, samples = 0, None
+    else:
+        path = sorted(glob.glob(os.path.join(directory, 'atop_[0-9]*')))[0]
+        interval = float(positional[0])
+        samples = int(positional[1]) if len(positional) > 1 else None
+
+    begin = None
+    if '-b' in options:
+        begin = int(datetime.strptime(options['-b'], '%Y%m%d%H%M').timestamp())
+
+    out = sys.stdout
+    printed = 0
+    for sample in _iterate_samples(path):
+        if samples is not None and printed == samples:
+            break
+        if begin is not None and int(sample[1].split(' ', 3)[2]) < begin:
+            continue
+        if not printed:
+            # output always starts with a 'RESET' line
+            sample[0] = 'RESET\n'
+        if interval:
+            out.flush()
+            time.sleep(interval)
+        for line in sample:
+            if 'ALL' in labels or line.split(' ', 1)[0].rstrip('\n') in labels:
+                out.write(line)
+        printed += 1
+    out.flush()
+
+
+def _iterate_samples(path):
+    'Iterate through lists of lines of every sample of a corpus log, each starts with its RESET or SEP line.'
+
+    sample = []
+    with open(path) as f:
+        for line in f:
+            if line in ('RESET\n', 'SEP\n') and sample:
+                yield sample
+                sample = []
+            sample.append(line)
+    if sample:
+        yield sample
+
+
+# stages measured by `run_benchmarks`, each runs in a fresh process
+BENCH_STAGES = (
+    'iterate_atop_records',
+    'iterate_atop_records_workers',
+    'iterate_atop_batches',
+    'to_pandas',
+    'to_pandas_compact',
+    'to_sqlite',
+    'generate_paths',
+)
+
+
+def run_benchmarks(directory, stages=BENCH_STAGES, record_types=('ALL',), repeat=1):
+    '''Run benchmark stages over a corpus written by `write_corpus`.
+
+    :param repeat: run every stage this many times and keep the fastest run
+    :returns: dict of stage -> {'seconds', 'lines_per_s', 'records_per_s', 'peak_rss'}
+              (peak resident set size of the stage process in bytes)
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    with open(os.path.join(directory, 'corpus.json')) as f:
+        lines = json.load(f)['lines']
+
+    results = {}
+    for stage in stages:
+        if stage not in BENCH_STAGES:
+            raise ValueError(f'unknown stage: {stage!r}')
+        runs = []
+        for _ in range(repeat):
+            # a new process per run so peak RSS is of the stage only
+            with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+                runs.append(pool.submit(_run_stage, stage, directory, tuple(record_types)).result())
+        seconds, records, peak_rss = min(runs)
+        results[stage] = {
+            'seconds': seconds,
+            # generate_paths does not read anything
+            'lines_per_s': lines / seconds if 'ALL' in record_types and stage != 'generate_paths' else None,
+            'records_per_s': records / seconds if records else None,
+            'peak_rss': peak_rss,
+        }
+    return results
+
+
+def _run_stage(stage, directory, record_types):
+    import resource
+    import tempfile
+    from collections import deque
+
+    import atop_reader
+
+    files = atop_reader.list_atop_logs(directory)
+    binary = os.path.join(directory, 'atop')
+    records = None
+
+    start = time.perf_counter()
+
+    if stage == 'iterate_atop_records':
+        counter = _Counter()
+        deque(counter(atop_reader.iterate_atop_records(files, record_types, binary)), maxlen=0)
+        records = counter.n
+    elif stage == 'iterate_atop_records_workers':
+        counter = _Counter()
+        iterator = atop_reader.iterate_atop_records(files, record_types, binary, workers=os.cpu_count())
+        deque(counter(iterator), maxlen=0)
+        records = counter.n
+    elif stage == 'iterate_atop_batches':
+        batches = atop_reader.iterate_atop_batches(files, record_types, binary)
+        records = sum(len(columns['epoch']) for _, columns in batches)
+    elif stage in ('to_pandas', 'to_pandas_compact'):
+        frames = atop_reader.to_pandas(atop_reader.iterate_atop_records(files, record_types, binary),
+                                       compact=stage == 'to_pandas_compact')
+        records = sum(len(df) for df in frames.values())
+    elif stage == 'to_sqlite':
+        with tempfile.TemporaryDirectory() as tmp:
+            counter = _Counter()
+            iterator = counter(atop_reader.iterate_atop_records(files, record_types, binary))
+            atop_reader.to_sqlite(os.path.join(tmp, 'bench.db'), iterator).close()
+            records = counter.n
+    elif stage == 'generate_paths':
+        import helpers
+
+        frames = atop_reader.to_pandas(atop_reader.iterate_atop_records(files, ['PRG'], binary))
+        df_ps = frames['PRG'].rename(columns={'sample_n': 'Sample_n', 'TID': 'PRG_TID',
+                                              'PPID': 'PRG_PPID', 'name': 'PRG_name'})
+        # only time the paths, not reading
+        start = time.perf_counter()
+        helpers.generate_paths(df_ps)
+        records = len(df_ps)
+
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in KiB on linux, children are atop and worker processes
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+    return seconds, records, peak_rss
+
+
+class _Counter:
+    'Count items passing through an iterator.'
+
+    def __init__(self):
+        self.n = 0
+
+    def __call__(self, iterator):
+        for n, item in enumerate(iterator, 1):
+            self.n = n
+            yield item
+
+
+def _print_results(results, baseline=None):
+    header = f'{"stage":<30} {"seconds":>9} {"lines/s":>11} {"records/s":>11} {"peak RSS":>10}'
+    if baseline:
+        header += f' {"vs baseline":>12}'
+    print(header)
+
+    for stage, r in results.items():
+        rate = lambda v: f'{v:11,.0f}' if v else f'{"-":>11}'
+        line = (f'{stage:<30} {r["seconds"]:9.3f} {rate(r["lines_per_s"])} {rate(r["records_per_s"])} '
+                f'{r["peak_rss"] / 2**20:8.1f}Mi')
+        if baseline and stage in baseline:
+            line += f' {baseline[stage]["seconds"] / r["seconds"]:11.2f}x'
+        print(line)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the atop reader and writers.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    corpus = commands.add_parser('corpus', help='write a synthetic corpus')
+    corpus.add_argument('directory')
+    corpus.add_argument('--days', type=int, default=3)
+    corpus.add_argument('--samples-per-day', type=int, default=144)
+    corpus.add_argument('--processes', type=int, default=200)
+    corpus.add_argument('--thread-ratio', type=float, default=.5)
+    corpus.add_argument('--cpus', type=int, default=4)
+    corpus.add_argument('--disks', type=int, default=2)
+    corpus.add_argument('--interfaces', type=int, default=2)
+    corpus.add_argument('--reboots-per-day', type=int, default=0)
+    corpus.add_argument('--seed', type=int, default=0)
+
+    run = commands.add_parser('run', help='run benchmarks over a corpus')
+    run.add_argument('directory')
+    run.add_argument('--stages', nargs='+', default=BENCH_STAGES, choices=BENCH_STAGES)
+    run.add_argument('--types', nargs='+', default=['ALL'], help='record types to read')
+    run.add_argument('--repeat', type=int, default=1)
+    run.add_argument('--baselines', default='bench_baselines', help='directory of stored baselines')
+    run.add_argument('--save', metavar='NAME', help='store the results as a baseline')
+    run.add_argument('--compare', metavar='NAME', help='compare the results with a stored baseline')
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['replay']:
+        return replay(argv[1], argv[2:])
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'corpus':
+        files = write_corpus(args.directory, args.days, args.samples_per_day, args.processes, args.thread_ratio,
+                             args.cpus, args.disks, args.interfaces, args.reboots_per_day, seed=args.seed)
+        size = sum(os.path.getsize(f) for f in files)
+        print(f'{len(files)} logs, {size / 2**20:.1f}Mi written to {args.directory}')
+        return
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(args.baselines, f'{args.compare}.json')) as f:
+            baseline = json.load(f)['results']
+
+    results = run_benchmarks(args.directory, args.stages, args.types, args.repeat)
+    _print_results(results, baseline)
+
+    if args.save:
+        with open(os.path.join(args.directory, 'corpus.json')) as f:
+            corpus_params = json.load(f)
+        os.makedirs(args.baselines, exist_ok=True)
+        with open(os.path.join(args.baselines, f'{args.save}.json'), 'w') as f:
+            json.dump({'time': time.time(), 'corpus': corpus_params, 'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
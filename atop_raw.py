@@ -0,0 +1,263 @@
+'''Native reader of atop raw log files (the ones written by `atop -w`).
+
+Decodes the binary log directly instead of running `atop -r <file> -P ...`
+and produces the same records as `atop_reader.iterate_atop_records`.
+
+The raw format is a copy of atop's in-memory C structures, so it depends on the
+atop version that wrote the log. Layouts are declared in `_TSTAT_LAYOUTS` keyed by
+the struct size found in the file header, logs with an unknown layout are rejected
+rather than misread. Currently only per process records (PRG, PRC, PRM, PRD, PRN)
+are decoded, system wide records still need the atop backend.
+
+Examples:
+
+# use the native backend
+for record in iterate_atop_records(list_atop_logs()[-2:], record_types=['PRG'], backend='raw'):
+    print(record)
+'''
+import mmap
+import zlib
+import struct
+from collections import namedtuple
+
+
+__all__ = [
+    'RAW_RECORD_TYPES',
+    'read_raw_header',
+    'iterate_raw_samples',
+    'iterate_raw_records',
+]
+
+
+RAW_RECORD_TYPES = ('PRG', 'PRC', 'PRM', 'PRD', 'PRN')
+
+MAGIC = 0xfeedbeef
+
+# rawrecord flags
+RRBOOT = 0x0001
+
+# rawheader supportflags
+IOSTAT = 0x0004
+NETATOP = 0x0010
+
+RawHeader = namedtuple('RawHeader', [
+    'magic', 'aversion', 'rawheadlen', 'rawreclen', 'hertz',
+    'sstatlen', 'tstatlen', 'nodename', 'pagesize', 'supportflags'])
+
+RawSample = namedtuple('RawSample', [
+    'offset', 'curtime', 'flags', 'scomplen', 'pcomplen', 'interval', 'ndeviat'])
+
+# struct rawheader
+_HEADER = struct.Struct('<IHHHHHH6HII390s8s2xIiiii6i')
+# struct rawrecord
+_RECORD = struct.Struct('<qH3H13I6I4x')
+
+# struct tstat, one entry per supported layout keyed by its size
+_TSTAT_LAYOUTS = {}
+
+_TSTAT_23 = struct.Struct(
+    '<'
+    # gen
+    '12i'  # tgid pid ppid ruid euid suid fsuid rgid egid sgid fsgid nthr
+    '16s'  # name
+    'cc2x'  # isproc state
+    'i'  # excode
+    'qq'  # btime elaps
+    '256s'  # cmdline
+    '3i'  # nthrslpi nthrslpu nthrrun
+    '3i'  # ctid vpid wasinactive
+    '16s'  # container[13] and the padding of struct gen
+    # cpu
+    'qq6i4i4q'  # utime stime nice prio rtprio policy curcpu sleepavg ifuture cfuture
+    # dsk
+    '5q4q'  # rio rsz wio wsz cwsz cfuture
+    # mem
+    '12q4q'  # minflt majflt vexec vmem rmem pmem vgrow rgrow vdata vstack vlibs vswap cfuture
+    # net
+    '10q4q'  # tcpsnd tcpssz tcprcv tcprsz udpsnd udpssz udprcv udprsz avail1 avail2 cfuture
+)
+_TSTAT_LAYOUTS[_TSTAT_23.size] = _TSTAT_23
+
+
+def read_raw_header(buf):
+    'Parse the header of an atop raw log.'
+
+    if len(buf) < _HEADER.size:
+        raise ValueError('not an atop raw log: file is too short')
+
+    vals = _HEADER.unpack_from(buf, 0)
+    magic, aversion, _, _, rawheadlen, rawreclen, hertz = vals[:7]
+    sstatlen, tstatlen, utsname = vals[13:16]
+    pagesize, supportflags = vals[17:19]
+
+    if magic != MAGIC:
+        raise ValueError(f'not an atop raw log: bad magic {magic:#x}')
+    if rawreclen != _RECORD.size:
+        raise ValueError(f'unsupported atop raw log layout (atop version {aversion & 0x7fff:#x}, '
+                         f'rawrecord length {rawreclen})')
+
+    # utsname is 6 fields of 65 chars, nodename is the second one
+    nodename = _cstr(utsname[65:130])
+
+    return RawHeader(magic, aversion, rawheadlen, rawreclen, hertz,
+                     sstatlen, tstatlen, nodename, pagesize, supportflags)
+
+
+def iterate_raw_samples(buf, header, offset=None):
+    '''Iterate through the samples of an atop raw log without decompressing them.
+
+    :param offset: start at the sample stored at this byte offset
+                   (as previously returned in `RawSample.offset`)
+    :returns: an iterator that yields `RawSample` tuples
+    '''
+
+    offset = header.rawheadlen if offset is None else offset
+    size = len(buf)
+
+    while offset + header.rawreclen <= size:
+        vals = _RECORD.unpack_from(buf, offset)
+        curtime, flags = vals[:2]
+        scomplen, pcomplen, interval, ndeviat = vals[5:9]
+
+        end = offset + header.rawreclen + scomplen + pcomplen
+        if end > size:
+            # sample is still being written
+            break
+
+        yield RawSample(offset, curtime, flags, scomplen, pcomplen, interval, ndeviat)
+        offset = end
+
+
+def iterate_raw_records(path, record_types, sample_n, boot_n, infer_types=True, time_range=None):
+    '''Iterate through records of a single atop raw log continuing the given numbering.
+    Same as reading `atop -r <path> -P <record_types>` output, see `atop_reader._iterate_file_records`.
+
+    :param infer_types: yield values typed as in `ATOP_SCHEMA` (the types `atop_reader` decoders
+                        convert to with the default schema), strings as printed by atop otherwise
+    :param time_range: tuple of (start, end) epochs, samples outside of it are skipped
+                       without being decompressed (but still numbered)
+
+    :returns: (via StopIteration) `sample_n` and `boot_n` after the last sample of the file
+    '''
+
+    if 'ALL' in record_types:
+        record_types = RAW_RECORD_TYPES
+    unsupported = set(record_types) - set(RAW_RECORD_TYPES)
+    if unsupported:
+        raise ValueError(f'record types not supported by the raw backend: {sorted(unsupported)}')
+    # atop prints record types in a fixed order
+    record_types = [t for t in RAW_RECORD_TYPES if t in record_types]
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        header = read_raw_header(buf)
+
+        tstat = _TSTAT_LAYOUTS.get(header.tstatlen)
+        if tstat is None:
+            raise ValueError(f'unsupported atop raw log layout (atop version {header.aversion & 0x7fff:#x}, '
+                             f'tstat length {header.tstatlen}): {path}')
+
+        formatters = [_FORMATTERS[t] for t in record_types]
+        start_epoch, end_epoch = time_range or (None, None)
+
+        # numbered exactly as `atop -P` output is read: atop prints 'RESET' before every sample
+        # flagged as taken after a boot (the one of the first sample, a log reset, is skipped)
+        # and 'SEP' after every sample, each of them starts a new sample number
+        sample_n += 1
+
+        for i, sample in enumerate(iterate_raw_samples(buf, header)):
+            if i and sample.flags & RRBOOT:
+                # 'RESET'
+                boot_n += 1
+                sample_n += 1
+
+            if ((start_epoch is None or sample.curtime >= start_epoch)
+                    and (end_epoch is None or sample.curtime < end_epoch)):
+                start = sample.offset + header.rawreclen + sample.scomplen
+                tasks = zlib.decompress(buf[start:start + sample.pcomplen])
+
+                generic = (sample.curtime, sample.interval, sample_n, boot_n, path)
+                if not infer_types:
+                    generic = (str(sample.curtime), str(sample.interval), sample_n, boot_n, path)
+                tasks = [_decode_task(t) for t in tstat.iter_unpack(tasks[:sample.ndeviat * tstat.size])]
+
+                for type_, formatter in zip(record_types, formatters):
+                    for task in tasks:
+                        vals = formatter(task, header)
+                        if not infer_types:
+                            vals = [_yn(v) if v is True or v is False else str(v) for v in vals]
+                        yield (type_, *generic, *vals)
+
+            # 'SEP'
+            sample_n += 1
+
+    return sample_n, boot_n
+
+
+def _cstr(b):
+    return b.split(b'\0', 1)[0].decode('utf8', 'replace')
+
+
+def _yn(flag):
+    return 'y' if flag else 'n'
+
+
+def _decode_task(vals):
+    vals = list(vals)
+    # name, isproc, state, cmdline, container
+    vals[12] = _cstr(vals[12])
+    vals[13] = vals[13] != b'\0'
+    vals[14] = vals[14].decode('ascii', 'replace')
+    vals[18] = _cstr(vals[18])
+    vals[25] = _cstr(vals[25])
+    return vals
+
+
+def _exit_code(excode):
+    # same as atop: signal number + 256 or the exit status
+    if excode & 0xff:
+        return (excode & 0x7f) + 256
+    return (excode >> 8) & 0xff
+
+
+def _format_prg(t, header):
+    (tgid, pid, ppid, ruid, euid, suid, fsuid, rgid, egid, sgid, fsgid, nthr,
+     name, isproc, state, excode, btime, elaps, cmdline,
+     nthrslpi, nthrslpu, nthrrun, ctid, vpid, _, container) = t[:26]
+    return (pid, name, state, ruid, rgid, tgid, nthr, _exit_code(excode), btime,
+            cmdline or name, ppid, nthrrun, nthrslpi, nthrslpu, euid, egid, suid, sgid,
+            fsuid, fsgid, elaps, bool(isproc), vpid, ctid, container or '-')
+
+
+def _format_prc(t, header):
+    utime, stime, nice, prio, rtprio, policy, curcpu, sleepavg = t[26:34]
+    return (t[1], t[12], t[14], header.hertz, utime, stime, nice, prio, rtprio,
+            policy, curcpu, sleepavg, t[0], bool(t[13]))
+
+
+def _format_prd(t, header):
+    rio, rsz, wio, wsz, cwsz = t[42:47]
+    return (t[1], t[12], t[14], False, bool(header.supportflags & IOSTAT),
+            rio, rsz, wio, wsz, cwsz, t[0], False, bool(t[13]))
+
+
+def _format_prm(t, header):
+    minflt, majflt, vexec, vmem, rmem, pmem, vgrow, rgrow, vdata, vstack, vlibs, vswap = t[51:63]
+    # atop stores -1 when proportional set size was not gathered
+    pmem = 0 if pmem == -1 else pmem
+    return (t[1], t[12], t[14], header.pagesize, vmem, rmem, vexec, vgrow, rgrow,
+            minflt, majflt, vlibs, vdata, vstack, vswap, t[0], bool(t[13]), pmem)
+
+
+def _format_prn(t, header):
+    tcpsnd, tcpssz, tcprcv, tcprsz, udpsnd, udpssz, udprcv, udprsz = t[67:75]
+    return (t[1], t[12], t[14], bool(header.supportflags & NETATOP),
+            tcpsnd, tcpssz, tcprcv, tcprsz, udpsnd, udpssz, udprcv, udprsz, 0, 0, t[0], bool(t[13]))
+
+
+_FORMATTERS = {
+    'PRG': _format_prg,
+    'PRC': _format_prc,
+    'PRM': _format_prm,
+    'PRD': _format_prd,
+    'PRN': _format_prn,
+}
@@ -6,50 +6,170 @@ Examples:
 for record in iterate_atop_records(list_atop_logs()[-2:]):
     print(record)
 
+# decode 4 files at a time in worker processes
+for record in iterate_atop_records(list_atop_logs(), workers=4):
+    print(record)
+
+# build dataframes from per type column batches
+frames = to_pandas(iterate_atop_batches(list_atop_logs()[-2:]))
+
 # convert to sqlite
 iterator = iterate_atop_records(list_atop_logs()[-2:])
 conn = to_sqlite('atop.db', iterator)
 conn.close()
 
+# convert to sqlite trading durability for speed
+conn = to_sqlite('atop.db', iterator, journal_mode='WAL', synchronous='OFF', cache_size=-256000)
+
+# read only what is needed: one service over two hours, a few columns
+columns = {'PRC': ['TID', 'name', 'cpu_usr', 'cpu_sys']}
+iterator = iterate_atop_records(list_atop_logs()[-1:], record_types=['PRC'],
+                                time_range=(1508882400, 1508889600), names=['^nginx'],
+                                processes_only=True, columns=columns)
+frames = to_pandas(iterator, schema=project_schema(parse_atop_schema(ATOP_SCHEMA), columns))
+
+# only read logs overlapping a time window
+index = index_atop_logs(list_atop_logs(), index_path='atop_index.json')
+start, end = 1508882400, 1508887800
+iterator = iterate_atop_records(select_atop_logs(index, start, end), time_range=(start, end))
+
+# keep sqlite database up to date, only new logs and new samples are processed on each run
+ingest_sqlite('atop.db', list_atop_logs()).close()
+
+# keep a live sqlite database: one transaction per 10 seconds sample
+conn = append_sqlite('live.db', iterate_live_records(10, record_types=['CPU', 'PRC'], by_sample=True))
+
+# or follow the log written by the atop daemon
+conn = append_sqlite('live.db', follow_atop_records(poll_interval=60, by_sample=True))
+
+# collect logs of many hosts into one database, 8 atop processes at a time
+hosts = {host: list_atop_logs(os.path.join('/srv/atop', host)) for host in os.listdir('/srv/atop')}
+hosts_to_sqlite('fleet.db', hosts, record_types=['CPU', 'DSK', 'PRC'], concurrency=8).close()
+
+# one row per process and sample with PRG, PRC, PRM and PRD fields side by side
+types = ['PRG', 'PRC', 'PRM', 'PRD']
+iterator = merge_process_records(iterate_atop_records(list_atop_logs()[-1:], types), types)
+frames = to_pandas(iterator, schema=merge_process_schema(parse_atop_schema(ATOP_SCHEMA), types))
+frames['PS']
+
+# store every process once instead of repeating its name, command line, ... in every sample
+conn = to_sqlite('atop.db', iterate_atop_records(list_atop_logs()[-2:]), split_processes=True)
+conn.execute('SELECT p.cmd, g.state FROM PRG g JOIN PROCESS p USING (process_id)')
+
+# read into dataframes caching parsed logs between sessions
+frames = read_pandas(list_atop_logs()[-7:], ['CPU', 'PRC'], cache_dir='atop_cache')
+
+# only read the record types actually used, 4 of them at a time on `load`
+frames = read_pandas(list_atop_logs()[-7:], lazy=True, workers=4)
+frames['DSK']
+frames.load(['CPU', 'MEM', 'PRC', 'PRM'])
+
+# a week of process records in a fraction of memory (categoricals and downcast numbers)
+frames = read_pandas(list_atop_logs()[-7:], ['PRG', 'PRM'], compact=True)
+
+# rates (per second) and utilization percentages next to the raw per interval values
+frames = derive_metrics(to_pandas(iterate_atop_records(list_atop_logs()[-2:])), max_interval_deviation=50)
+frames['DSK'][['name', 'ms_spent_pct', 'reads_rate', 'writes_rate']]
+
+# keep 1m/10m/1h aggregates next to the records for dashboards over long ranges
+ingest_sqlite('atop.db', list_atop_logs(), rollups=('1m', '10m', '1h')).close()
+
+# find out where the time goes, optionally with a cProfile (or tracemalloc) capture
+stats = AtopStats(callback=lambda stats: print(stats.counters['files'], 'files read'))
+with stats.capture('cprofile'):
+    to_sqlite('atop.db', iterate_atop_records(list_atop_logs()[-2:], stats=stats), stats=stats).close()
+print(stats.report())
+
 # print the available predefined atop schema
 print(ATOP_SCHEMA)
+
+Command line:
+
+# convert logs (rerun with --resume to continue an interrupted run)
+python -m atop_reader convert atop.db --start 2017-10-01 --end 2017-10-31 --types CPU DSK PRC --workers 8
 '''
 import os
 import re
 import glob
 from subprocess import Popen, PIPE
-from itertools import islice
+from itertools import islice, chain
 from collections import defaultdict
+from collections.abc import Mapping
 
 from atop_schema import ATOP_SCHEMA
 
 
 __all__ = [
     'ATOP_SCHEMA',
+    'AtopStats',
     'GENERIC_FIELDS',
     'list_atop_logs',
+    'index_atop_logs',
+    'select_atop_logs',
     'iterate_atop_records',
+    'iterate_atop_batches',
+    'iterate_live_records',
+    'follow_atop_records',
     'parse_atop_schema',
+    'project_schema',
+    'merge_process_schema',
+    'merge_process_records',
+    'split_process_schema',
+    'split_process_records',
     'to_sqlite',
+    'append_sqlite',
     'to_pandas',
+    'read_pandas',
+    'LazyFrames',
+    'derive_metrics',
+    'derive_batch_metrics',
+    'rollup_frames',
+    'update_sqlite_rollups',
+    'ingest_sqlite',
+    'ingest_parquet',
+    'ingest_csv',
+    'hosts_to_sqlite',
 ]
 
 
 GENERIC_FIELDS = ('type', 'epoch', 'sample_interval', 'sample_n', 'boot_n', 'log_file')
 _GENERIC_FIELDS_TYPES = (str, int, int, int, int, str)
-_SQL_TYPES = {float: 'REAL', int: 'INT', str: 'TEXT'}
+_FIELD_TYPES = {'int': int, 'float': float, 'str': str, 'bool': bool}
+_FIELD_UNITS = ('ticks', 'ms', 'count')
+_SQL_TYPES = {float: 'REAL', int: 'INT', str: 'TEXT', bool: 'INT'}
+_NUMPY_TYPES = {float: 'float64', int: 'int64', str: 'object', bool: 'bool'}
 
 _PRG_RECORD_RX = re.compile(r'^(\S+) \((.+)\) ([^()]+) \((.*)\) ([^()]+)$')
 _PRX_RECORD_RX = re.compile(r'^(\S+) \((.*)\) ([^()]+)$')
 
 
 def parse_atop_schema(text):
+    '''Parse schema description in the format of `ATOP_SCHEMA`.
+    Field lines are `name[:type[:unit]] - description` where type is one of int, float, str, bool
+    and unit tells how per interval values are turned into rates (see `derive_metrics`):
+    ticks (clock-ticks), ms (milliseconds spent) or count (anything counted within the interval).
+
+    :returns: dict of record type -> {'desc': description, 'fields': [[name, description], ...],
+                                      'types': [python type or None if not given, ...],
+                                      'units': [unit or None, ...]}
+    '''
+
     schema = {}
     for type_schema in text.strip().split('\n\n'):
-        type_line, *fields = type_schema.splitlines()
+        type_line, *lines = type_schema.splitlines()
         type_, desc = type_line.split(' - ')
-        fields = [f.split(' - ') for f in fields]
-        schema[type_] = {'desc': desc, 'fields': fields}
+        fields = []
+        types = []
+        units = []
+        for line in lines:
+            name, *field_desc = line.split(' - ')
+            name, field_type, unit = (name.split(':') + [None, None])[:3]
+            fields.append([name, *field_desc])
+            types.append(_FIELD_TYPES[field_type] if field_type else None)
+            if unit and unit not in _FIELD_UNITS:
+                raise ValueError(f'unknown unit of {type_} field {name}: {unit}')
+            units.append(unit or None)
+        schema[type_] = {'desc': desc, 'fields': fields, 'types': types, 'units': units}
     return schema
 
 
@@ -60,217 +180,3174 @@ def list_atop_logs(root='/var/log/atop'):
     return sorted(glob.glob(path))
 
 
-def iterate_atop_records(files, record_types=('ALL',), binary='atop', infer_types=True):
+def index_atop_logs(files, index_path=None, binary='atop'):
+    '''Build (or update) a time index of atop logs.
+
+    For each file the index keeps its size, mtime, epochs of the first and the last sample,
+    epochs of machine reboots and epoch of every sample. When a file can be parsed as an atop
+    raw log (see `atop_raw`) the index only needs to read sample headers and keeps the byte offset
+    past the last indexed sample, otherwise samples are listed with `atop -P CPL`.
+    Unchanged files are not read again and grown raw logs are only scanned past the last indexed sample.
+
+    :param files: atop logs as returned by `list_atop_logs`
+    :param index_path: optional json file to persist the index in
+    :returns: dict of path -> index entry
+    '''
+
+    import json
+
+    index = {}
+    if index_path and os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+
+    updated = {}
+    for path in files:
+        stat = os.stat(path)
+        entry = index.get(path)
+        if entry is None or (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime):
+            entry = _index_atop_log(path, stat, entry, binary)
+        updated[path] = entry
+
+    if index_path and updated != index:
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(updated, f)
+        os.replace(index_path + '.tmp', index_path)
+
+    return updated
+
+
+def select_atop_logs(index, start=None, end=None):
+    '''Select logs having samples within given time window (start <= epoch < end).
+
+    :param index: as returned by `index_atop_logs`
+    :returns: sorted list of paths
+    '''
+
+    selected = []
+    for path, entry in index.items():
+        if entry['first_epoch'] is None:
+            continue
+        if (start is None or entry['last_epoch'] >= start) and (end is None or entry['first_epoch'] < end):
+            selected.append(path)
+    return sorted(selected)
+
+
+def _index_atop_log(path, stat, entry, binary):
+    from atop_raw import RRBOOT, read_raw_header, iterate_raw_samples
+    import mmap
+
+    epochs = []
+    boots = []
+
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header = read_raw_header(buf)
+
+            next_offset = None
+            if entry is not None and entry.get('next_offset') and stat.st_size >= entry['size']:
+                # the log only grew, continue after the last indexed sample
+                epochs, boots = entry['epochs'], entry['boots']
+                next_offset = entry['next_offset']
+
+            for sample in iterate_raw_samples(buf, header, next_offset):
+                # first reset is a log reset not a machine reboot
+                if epochs and sample.flags & RRBOOT:
+                    boots.append(sample.curtime)
+                epochs.append(sample.curtime)
+                next_offset = sample.offset + header.rawreclen + sample.scomplen + sample.pcomplen
+    except ValueError:
+        # not a raw log we can read, ask atop for sample times
+        next_offset = None
+        p = Popen([binary, '-r', path, '-P', 'CPL'], stdout=PIPE, encoding='utf8')
+        p.stdout.readline()
+        reset = False
+        for line in p.stdout:
+            if line == 'RESET\n':
+                reset = True
+            elif line.startswith('CPL '):
+                epoch = int(line.split(maxsplit=3)[2])
+                epochs.append(epoch)
+                if reset:
+                    boots.append(epoch)
+                    reset = False
+        p.stdout.close()
+        p.wait()
+
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'first_epoch': epochs[0] if epochs else None,
+        'last_epoch': epochs[-1] if epochs else None,
+        'boots': boots,
+        'epochs': epochs,
+        'next_offset': next_offset,
+    }
+
+
+class AtopStats:
+    '''Counters and timers of reading and writing atop records.
+
+    Pass the same object as `stats` to `iterate_atop_records`, `iterate_atop_batches`,
+    `to_pandas` and `to_sqlite`, nothing is measured without it.
+
+    Timers (seconds): read (waiting for atop output), filter (line filters), split (generic fields),
+    decode (type specific fields, also per type as decode.<type>), raw (native raw backend),
+    pandas (building dataframes) and sqlite (inserting records).
+    Counters: files, lines, bytes (read from atop), lines_filtered, records (also per type as records.<type>),
+    rows.pandas and rows.sqlite.
+
+    :param callback: called with the stats object after every file is read
+    '''
+
+    def __init__(self, callback=None):
+        import time
+
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.callback = callback
+        self.started = time.perf_counter()
+        # results of `capture`: pstats.Stats and tracemalloc.Snapshot
+        self.profile = None
+        self.memory = None
+
+    def __getstate__(self):
+        # sent to and from worker processes without the callback
+        return dict(self.__dict__, callback=None, profile=None, memory=None)
+
+    def merge(self, other):
+        'Add counters and timers of another stats object (e.g. from a worker process).'
+
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        for name, value in other.timers.items():
+            self.timers[name] += value
+
+    def file_done(self):
+        'Count a file that has been read.'
+
+        self.counters['files'] += 1
+        if self.callback:
+            self.callback(self)
+
+    def as_dict(self):
+        '''Snapshot of the stats.
+
+        :returns: dict with elapsed seconds, counters, timers and rates per second
+        '''
+
+        import time
+
+        elapsed = time.perf_counter() - self.started
+        rates = {f'{name}_per_s': self.counters[name] / elapsed if elapsed else None
+                 for name in ('lines', 'bytes', 'records')}
+        return {'elapsed': elapsed, 'counters': dict(self.counters), 'timers': dict(self.timers), 'rates': rates}
+
+    def report(self, limit=20):
+        'Human readable summary, with the top `limit` entries of a captured profile.'
+
+        import io
+
+        stats = self.as_dict()
+        lines = [f'elapsed: {stats["elapsed"]:.3f}s']
+        lines += [f'{name:>20}: {value:,.0f}/s' for name, value in stats['rates'].items() if value]
+        lines += [f'{name:>20}: {value:.3f}s' for name, value in sorted(stats['timers'].items())]
+        lines += [f'{name:>20}: {value:,}' for name, value in sorted(stats['counters'].items())]
+
+        if self.profile is not None:
+            out = io.StringIO()
+            self.profile.stream = out
+            self.profile.sort_stats('cumulative').print_stats(limit)
+            lines.append(out.getvalue())
+        if self.memory is not None:
+            lines.append(f'top {limit} allocations:')
+            lines += [f'  {stat}' for stat in self.memory.statistics('lineno')[:limit]]
+
+        return '\n'.join(lines)
+
+    def capture(self, mode='cprofile'):
+        '''Context manager capturing a profile of the code run within it.
+
+        :param mode: 'cprofile' stores `pstats.Stats` into `profile`,
+                     'tracemalloc' stores a snapshot into `memory` and peak traced memory
+                     into the `memory_peak` counter
+        '''
+
+        from contextlib import contextmanager
+
+        if mode not in ('cprofile', 'tracemalloc'):
+            raise ValueError(f'unknown capture mode: {mode!r}')
+
+        @contextmanager
+        def capture():
+            if mode == 'cprofile':
+                import pstats
+                import cProfile
+
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    yield self
+                finally:
+                    profiler.disable()
+                    self.profile = pstats.Stats(profiler)
+            else:
+                import tracemalloc
+
+                tracemalloc.start()
+                try:
+                    yield self
+                finally:
+                    self.memory = tracemalloc.take_snapshot()
+                    self.counters['memory_peak'] = max(self.counters['memory_peak'],
+                                                       tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+
+        return capture()
+
+
+class _TimedIterator:
+    'Iterator wrapper measuring time spent producing items, the rest is the consumer own time.'
+
+    def __init__(self, iterator):
+        from time import perf_counter
+
+        self.iterator = iter(iterator)
+        self.clock = perf_counter
+        self.seconds = 0.0
+        self.n = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = self.clock()
+        try:
+            item = next(self.iterator)
+        finally:
+            self.seconds += self.clock() - start
+        self.n += 1
+        return item
+
+
+def iterate_atop_records(files, record_types=('ALL',), binary='atop', infer_types=True, workers=None,
+                         backend='atop', schema='default', time_range=None, pids=None, names=None,
+                         processes_only=False, columns=None, stats=None):
     '''Iterate through atop records processing each given file sequentially.
 
+    Records can be filtered while reading, lines that do not pass the filters are skipped
+    before being split into fields and converted. Process filters (`pids`, `names`, `processes_only`)
+    only apply to per process record types (PRG, PRC, PRM, PRD, PRN), other records are kept as is.
+    Filtered out records do not affect `sample_n` and `boot_n` numbering.
+
+    :param workers: number of worker processes decoding files in parallel,
+                    records are still yielded in the order of `files` and numbered
+                    exactly as in the sequential mode; `None` reads in the current process.
+                    Workers hand decoded records over as columns, 10 samples at a time,
+                    and pause when they are 40 samples ahead of the consumer
+    :param backend: 'atop' to decode files with the atop `binary`,
+                    'raw' to decode atop raw logs natively (see `atop_raw`, per process types only)
+    :param time_range: tuple of (start, end) epochs, only records with start <= epoch < end are kept,
+                       either can be `None`
+    :param pids: only keep process records with TID or TGID in this set
+    :param names: only keep process records with name matching any of these regular expressions
+                  (with `re.search`)
+    :param processes_only: drop per thread records (the ones with is_process == 'n')
+    :param columns: optional dict of record type -> list of fields from `schema` to keep,
+                    generic fields are always kept, see `project_schema` to describe the result
+    :param stats: optional `AtopStats` to collect counters and timers into
     :returns: an iterater that yields tuples of values:
               tuple(*generic_fields, *type_specific_fields)
               to get the list of `generic_fields` see `GENERIC_FIELDS`
               to get the list of `type_specific_fields` see `ATOP_SCHEMA` and `parse_atop_schema`
     '''
 
+    if backend not in ('atop', 'raw'):
+        raise ValueError(f'unknown backend: {backend!r}')
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    reader_kw = dict(record_types=record_types, binary=binary, infer_types=infer_types, backend=backend,
+                     schema=schema, time_range=time_range, pids=pids, names=names,
+                     processes_only=processes_only, columns=columns, stats=stats)
+
+    if workers is not None and workers > 1:
+        yield from _runs_to_records(_iterate_atop_runs(files, workers, reader_kw))
+        return
+
     boot_n = 0
     sample_n = -1
 
-    types_cache = {}
+    decoders = {}
 
     for path in files:
-        p = Popen([binary, '-r', path, '-P', ','.join(record_types)], stdout=PIPE, encoding='utf8')
+        sample_n, boot_n = yield from _iterate_file_records(path, sample_n, boot_n, decoders, **reader_kw)
 
-        sample_n += 1
 
-        # first 'RESET' line usually log reset not machine reboot so we skip it
-        p.stdout.readline()
+def project_schema(schema, columns):
+    '''Describe records read with `iterate_atop_records(..., columns=columns)`.
 
-        for line in p.stdout:
+    :returns: copy of `schema` (as returned by `parse_atop_schema`) with only the given fields
+    '''
+
+    projected = dict(schema)
+    for type_, fields in columns.items():
+        names = [f[0] for f in schema[type_]['fields']]
+        positions = [names.index(f) for f in fields]
+        projected[type_] = {'desc': schema[type_]['desc'],
+                            'fields': [schema[type_]['fields'][i] for i in positions],
+                            'types': [schema[type_]['types'][i] for i in positions],
+                            'units': [schema[type_]['units'][i] for i in positions]}
+    return projected
+
+
+def merge_process_schema(schema, record_types=('PRG', 'PRC', 'PRM', 'PRD')):
+    '''Describe records yielded by `merge_process_records`.
+
+    :returns: copy of `schema` with a 'PS' entry holding the fields of `record_types` in order,
+              fields shared by several types (TID, name, state, ...) only once
+    '''
+
+    fields, types, units = [], [], []
+    for type_ in record_types:
+        entry = schema[type_]
+        for field, type_of_field, unit in zip(entry['fields'], entry['types'], entry['units']):
+            if field[0] not in [f[0] for f in fields]:
+                fields.append(field)
+                types.append(type_of_field)
+                units.append(unit)
+
+    merged = dict(schema)
+    merged['PS'] = {'desc': f'per process information ({", ".join(record_types)} joined on TID)',
+                    'fields': fields, 'types': types, 'units': units}
+    return merged
+
+
+def split_process_schema(schema):
+    '''Describe records yielded by `split_process_records`.
+
+    :returns: copy of `schema` with a 'PROCESS' entry (process_id and static PRG fields)
+              and the 'PRG' entry reduced to process_id, TID and the fields changing between samples
+    '''
+
+    entry = schema['PRG']
+    dimension, _, facts = _split_process_positions(entry)
+    id_field = (['process_id', 'process id (see the PROCESS table)'], int, None)
+
+    def subset(positions, desc):
+        picked = [id_field, *[(entry['fields'][i], entry['types'][i], entry['units'][i]) for i in positions]]
+        fields, types, units = (list(v) for v in zip(*picked))
+        return {'desc': desc, 'fields': fields, 'types': types, 'units': units}
+
+    split = dict(schema)
+    split['PROCESS'] = subset(dimension, 'processes (static PRG fields, first seen sample as generic fields)')
+    split['PRG'] = subset([dimension[0], *facts], entry['desc'])
+    return split
+
+
+def _split_process_positions(entry):
+    '''Positions of the dimension and of the fact fields within PRG fields of `entry`.
+
+    :returns: tuple of (dimension positions, number of key fields they start with, fact positions)
+    '''
+
+    names = [f[0] for f in entry['fields']]
+    if 'TID' not in names or 'start_epoch' not in names:
+        raise ValueError('PRG records need the TID and start_epoch fields to be split')
+    dimension = [names.index(f) for f in _PROCESS_DIMENSION_FIELDS if f in names]
+    keys = len([f for f in _PROCESS_KEY_FIELDS if f in names])
+    facts = [i for i in range(len(names)) if i not in dimension]
+    return dimension, keys, facts
+
+
+def _iterate_file_records(path, sample_n, boot_n, decoders, record_types=('ALL',), binary='atop',
+                          infer_types=True, backend='atop', schema=None, time_range=None, pids=None,
+                          names=None, processes_only=False, columns=None, stats=None, begin=None, runs=False):
+    '''Iterate through records of a single atop log continuing the given numbering.
+    See `iterate_atop_records` for parameters.
+
+    :param decoders: cache of record type -> decoder (see `_make_decoder`, `_make_caster`
+                     for the raw backend) shared between files
+    :param begin: epoch to start reading at (`atop -b`, rounded down to its minute), samples
+                  before it are not printed so numbering starts there; the raw backend reads
+                  every sample header anyway and ignores it, use `time_range` to filter
+    :param runs: yield runs of records (see `_iterate_output_runs`) instead of records,
+                 atop backend only (see `_iterate_file_runs`)
+
+    :returns: (via StopIteration) `sample_n` and `boot_n` after the last line of the file
+    '''
+
+    projections = _make_projections(schema, columns)
+
+    if backend == 'raw':
+        from atop_raw import iterate_raw_records
+        # native values are typed as in `ATOP_SCHEMA`, any other schema gets them converted
+        # from strings the same way the atop backend decoders would
+        cast = infer_types and not _has_atop_types(schema, record_types)
+        records = iterate_raw_records(path, record_types, sample_n, boot_n, infer_types and not cast, time_range)
+        if cast:
+            records = _cast_records(records, schema, decoders)
+        if stats is not None:
+            records = _timed_records(records, stats, 'raw')
+        keep = _make_record_filter(schema, time_range, pids, names, processes_only)
+        if keep is None and not projections:
+            counters = yield from records
+            if stats is not None:
+                stats.file_done()
+            return counters
+
+        counters = []
+        for record in _keep_return_value(records, counters):
+            if keep is None or keep(record):
+                projection = projections.get(record[0])
+                if projection is not None:
+                    record = record[:len(GENERIC_FIELDS)] + tuple(record[i] for i in projection)
+                yield record
+        if stats is not None:
+            stats.file_done()
+        return tuple(counters)
+
+    keep = _make_line_filter(time_range, pids, names, processes_only)
+
+    args = [binary, '-r', path, '-P', ','.join(record_types)]
+    if begin is not None:
+        import time
+        args += ['-b', time.strftime('%Y%m%d%H%M', time.localtime(begin))]
+    p = Popen(args, stdout=PIPE, encoding='utf8')
+
+    sample_n += 1
+
+    # first 'RESET' line usually log reset not machine reboot so we skip it
+    p.stdout.readline()
+
+    if stats is not None:
+        counters = yield from _iterate_output_records_timed(p.stdout, path, sample_n, boot_n, decoders, keep,
+                                                            schema, infer_types, projections, stats, runs)
+    elif runs:
+        counters = yield from _iterate_output_runs(p.stdout, path, sample_n, boot_n, decoders, keep,
+                                                   schema, infer_types, projections)
+    else:
+        counters = yield from _iterate_output_records(p.stdout, path, sample_n, boot_n, decoders, keep,
+                                                      schema, infer_types, projections)
+
+    p.stdout.close()
+    p.wait()
+
+    if stats is not None:
+        stats.file_done()
+
+    return counters
+
+
+def _iterate_output_records(lines, log_file, sample_n, boot_n, decoders, keep, schema, infer_types,
+                            projections, sample_ends=False):
+    '''Decode `atop -P` output lines (after the first 'RESET' line) continuing the given numbering.
+
+    :param lines: iterable of lines, a `None` line means the input is idle (see `iterate_live_records`)
+    :param sample_ends: yield `None` at every separator and idle line, i.e. wherever a sample may be complete
+
+    :returns: (via StopIteration) `sample_n` and `boot_n` after the last line
+    '''
+
+    for line in lines:
+        if line == 'RESET\n':
+            boot_n += 1
+            sample_n += 1
+            if sample_ends:
+                yield None
+        elif line == 'SEP\n':
+            sample_n += 1
+            if sample_ends:
+                yield None
+        elif line is None:
+            yield None
+        else:
+            try:
+                if keep is not None and not keep(line):
+                    continue
+
+                type_, _, epoch, _, _, interval, record_text = line.split(maxsplit=6)
+
+                if type_ == 'NET' and not record_text.startswith('upper '):
+                    type_ = 'NET_IF'
+                elif type_ == 'cpu':
+                    type_ = 'CPU_N'
+
+                decoder = decoders.get(type_)
+                if decoder is None:
+                    decoders[type_] = _make_decoder(type_, schema, infer_types, projections.get(type_))
+                    decoder = decoders[type_]
+
+                if infer_types:
+                    epoch, interval = int(epoch), int(interval)
+
+                yield (type_, epoch, interval, sample_n, boot_n, log_file) + decoder(record_text)
+            except Exception as e:
+                raise Exception('error parsing line: ' + line) from e
+
+    return sample_n, boot_n
+
+
+def _iterate_file_runs(path, sample_n, boot_n, decoders, backend='atop', **reader_kw):
+    '''Same as `_iterate_file_records(..., runs=True)` for both backends,
+    records of the raw backend are grouped into runs once decoded.'''
+
+    if backend == 'raw':
+        records = _iterate_file_records(path, sample_n, boot_n, decoders, backend=backend, **reader_kw)
+        return (yield from _records_to_runs(records))
+    return (yield from _iterate_file_records(path, sample_n, boot_n, decoders, backend=backend, runs=True,
+                                             **reader_kw))
+
+
+def _iterate_output_runs(lines, log_file, sample_n, boot_n, decoders, keep, schema, infer_types, projections):
+    '''Same as `_iterate_output_records` but consecutive records of one type and sample (a run)
+    are decoded together into columns, see `_make_run_decoder`.
+
+    :param decoders: cache of record type -> run decoder
+    :returns: an iterator that yields runs: tuple(*generic_fields, number of records, list of columns)
+              where columns hold the type specific values, and (via StopIteration) `sample_n`
+              and `boot_n` after the last line
+    '''
+
+    key = None
+    texts = []
+
+    def run():
+        type_, epoch, interval = key
+        decoder = decoders.get(type_)
+        if decoder is None:
+            decoders[type_] = _make_run_decoder(type_, schema, infer_types, projections.get(type_))
+            decoder = decoders[type_]
+        try:
+            columns = decoder(texts)
+        except Exception as e:
+            raise Exception(f'error parsing {type_} records of the sample at {epoch}') from e
+        if infer_types:
+            epoch, interval = int(epoch), int(interval)
+        return type_, epoch, interval, sample_n, boot_n, log_file, len(texts), columns
+
+    for line in lines:
+        if line == 'RESET\n' or line == 'SEP\n':
+            if texts:
+                yield run()
+                key = None
+                texts = []
             if line == 'RESET\n':
                 boot_n += 1
-                sample_n += 1
-            elif line == 'SEP\n':
-                sample_n += 1
-            else:
-                try:
-                    type_, _, epoch, _, _, interval, record_text = line.split(maxsplit=6)
-
-                    if type_ == 'PRG':
-                        pid, name, vals1, cmd, vals2 = _PRG_RECORD_RX.match(record_text).groups()
-                        record_vals = [pid, name] + vals1.split() + [cmd] + vals2.split()
-                    elif type_ in ('PRC', 'PRN', 'PRD', 'PRM'):
-                        pid, name, vals1 = _PRX_RECORD_RX.match(record_text).groups()
-                        record_vals = [pid, name] + vals1.split()
-                    else:
-                        record_vals = record_text.split()
+            sample_n += 1
+            continue
 
-                        if type_ == 'NET' and record_vals[0] != 'upper':
-                            type_ = 'NET_IF'
-                        elif type_ == 'cpu':
-                            type_ = 'CPU_N'
+        try:
+            if keep is not None and not keep(line):
+                continue
 
-                    vals = (type_, epoch, interval, sample_n, boot_n, path, *record_vals)
+            type_, _, epoch, _, _, interval, record_text = line.split(maxsplit=6)
 
-                    if infer_types:
-                        if type_ not in types_cache:
-                            types_cache[type] = _infer_types(vals)
-                        vals = tuple(typ(val) for typ, val in zip(types_cache[type], vals))
+            if type_ == 'NET' and not record_text.startswith('upper '):
+                type_ = 'NET_IF'
+            elif type_ == 'cpu':
+                type_ = 'CPU_N'
+        except Exception as e:
+            raise Exception('error parsing line: ' + line) from e
 
-                    yield vals
-                except Exception:
-                    raise Exception('error parsing line: ' + line)
+        if key is None or key[0] != type_ or key[1] != epoch:
+            if texts:
+                yield run()
+                texts = []
+            key = type_, epoch, interval
+        texts.append(record_text)
 
+    if texts:
+        yield run()
 
-def _infer_types(full_record):
-    types = []
-    for v in full_record[len(GENERIC_FIELDS):]:
-        if re.match(r'^-?\d+(\.\d+)?$', v):
-            types.append(float)
-        else:
-            types.append(str)
-    return _GENERIC_FIELDS_TYPES + tuple(types)
+    return sample_n, boot_n
 
 
-def _ensure_schema(full_record, schema):
-    fields = (*GENERIC_FIELDS, *[f[0] for f in schema[full_record[0]]['fields']])
-    assert len(full_record) == len(fields), (
-        'number of fields in the schema does not match number of values in the record; '
-        f'expected fields: {fields}; values: {record}')
+def _records_to_runs(records):
+    '''Group consecutive `records` of one type and sample into runs, see `_iterate_output_runs`.
 
+    :returns: (via StopIteration) return value of `records`
+    '''
 
-def to_pandas(iterator, progress=None, schema='default'):
-    '''Create pandas datafeame from given iterator returned by `iterate_atop_records`.
-    One table per record type.
+    n = len(GENERIC_FIELDS)
+    rows = []
+    while True:
+        try:
+            record = next(records)
+        except StopIteration as stop:
+            if rows:
+                yield (*rows[0][:n], len(rows), [list(values) for values in zip(*rows)][n:])
+            return stop.value
+        if rows and (record[0] != rows[0][0] or record[1] != rows[0][1] or record[3] != rows[0][3]):
+            yield (*rows[0][:n], len(rows), [list(values) for values in zip(*rows)][n:])
+            rows = []
+        rows.append(record)
+
+
+def _runs_to_records(runs):
+    '''Yield records of `runs`, see `_iterate_output_runs`.
+
+    :returns: (via StopIteration) return value of `runs`
+    '''
 
-    :returns: dictionary of dataframes
+    n = len(GENERIC_FIELDS)
+    while True:
+        try:
+            run = next(runs)
+        except StopIteration as stop:
+            return stop.value
+        generic = run[:n]
+        if run[-1]:
+            for values in zip(*run[-1]):
+                yield generic + values
+        else:
+            # no type specific field projected
+            for _ in range(run[n]):
+                yield generic
+
+
+def _shift_runs(runs, sample_shift, boot_shift):
+    '''Continue numbering of `runs` read from (-1, 0) at (`sample_shift` - 1, `boot_shift`).
+
+    :returns: (via StopIteration) the shifted return value of `runs`
     '''
 
-    import pandas as pd
-    from pandas import DataFrame
+    while True:
+        try:
+            run = next(runs)
+        except StopIteration as stop:
+            sample_n, boot_n = stop.value
+            return sample_n + sample_shift, boot_n + boot_shift
+        yield (*run[:3], run[3] + sample_shift, run[4] + boot_shift, *run[5:])
 
-    if schema == 'default':
-        schema = parse_atop_schema(ATOP_SCHEMA)
 
-    current_file = None
-    current_file_i = -1
+def _iterate_output_records_timed(lines, log_file, sample_n, boot_n, decoders, keep, schema, infer_types,
+                                  projections, stats, runs=False):
+    '''Same as `_iterate_output_records` (or `_iterate_output_runs` with `runs`)
+    measuring every step into `stats` (see `AtopStats`).
 
-    chunksize = 10000
+    Reading lines, filtering them and decoding records are timed by wrappers of `lines`, `keep`
+    and `decoders`, splitting lines into generic fields is the rest of the time spent in the loop.
+    '''
 
-    dataframes = {}
+    from time import perf_counter
+
+    counters = stats.counters
+    timers = stats.timers
+    # time measured by the wrappers, not part of 'split'
+    measured = [0.0]
+
+    def timed_lines():
+        lines_ = iter(lines)
+        while True:
+            start = perf_counter()
+            line = next(lines_, None)
+            elapsed = perf_counter() - start
+            timers['read'] += elapsed
+            measured[0] += elapsed
+            if line is None:
+                return
+            counters['lines'] += 1
+            counters['bytes'] += len(line)
+            yield line
+
+    def timed_keep(line):
+        start = perf_counter()
+        kept = keep(line)
+        elapsed = perf_counter() - start
+        timers['filter'] += elapsed
+        measured[0] += elapsed
+        if not kept:
+            counters['lines_filtered'] += 1
+        return kept
+
+    iterate = _iterate_output_runs if runs else _iterate_output_records
+    records = iterate(timed_lines(), log_file, sample_n, boot_n, _TimedDecoders(decoders, stats, measured, runs),
+                      None if keep is None else timed_keep, schema, infer_types, projections)
+    total = 0.0
+    try:
+        while True:
+            start = perf_counter()
+            try:
+                record = next(records)
+            except StopIteration as stop:
+                total += perf_counter() - start
+                return stop.value
+            total += perf_counter() - start
+            yield record
+    finally:
+        timers['split'] += total - measured[0]
+
+
+class _TimedDecoders:
+    '''Wrapper of a decoders cache (see `_iterate_output_records`) timing and counting decoded records,
+    `runs` when the decoders are run decoders (see `_iterate_output_runs`).'''
+
+    def __init__(self, decoders, stats, measured, runs=False):
+        self.decoders = decoders
+        self.stats = stats
+        self.measured = measured
+        self.runs = runs
+        self.timed = {}
+
+    def get(self, type_):
+        timed = self.timed.get(type_)
+        if timed is None and type_ in self.decoders:
+            timed = self.timed[type_] = self._wrap(type_, self.decoders[type_])
+        return timed
+
+    def __getitem__(self, type_):
+        timed = self.get(type_)
+        if timed is None:
+            raise KeyError(type_)
+        return timed
+
+    def __setitem__(self, type_, decoder):
+        self.decoders[type_] = decoder
+        self.timed.pop(type_, None)
+
+    def _wrap(self, type_, decoder):
+        from time import perf_counter
+
+        counters = self.stats.counters
+        timers = self.stats.timers
+        measured = self.measured
+        runs = self.runs
+        timer = f'decode.{type_}'
+        counter = f'records.{type_}'
+
+        def decode(text):
+            start = perf_counter()
+            values = decoder(text)
+            elapsed = perf_counter() - start
+            timers['decode'] += elapsed
+            timers[timer] += elapsed
+            measured[0] += elapsed
+            n = len(text) if runs else 1
+            counters['records'] += n
+            counters[counter] += n
+            return values
+
+        return decode
+
+
+def _timed_records(records, stats, timer):
+    '''Yield from `records` adding time spent producing them to `timer` of `stats` and counting them.
+
+    :returns: (via StopIteration) return value of `records`
+    '''
+
+    from time import perf_counter
+
+    counters = stats.counters
+    timers = stats.timers
 
     while True:
-        chunk = list(islice(iterator, chunksize))
-        if not chunk:
-            break
+        start = perf_counter()
+        try:
+            record = next(records)
+        except StopIteration as stop:
+            timers[timer] += perf_counter() - start
+            return stop.value
+        timers[timer] += perf_counter() - start
+        counters['records'] += 1
+        counters[f'records.{record[0]}'] += 1
+        yield record
+
+
+_PROCESS_TYPES = ('PRG', 'PRC', 'PRM', 'PRD', 'PRN')
+
+# PRG fields of the process dimension (see `split_process_records`), a row is told apart by boot_n
+# and the key fields, so exec or setproctitle changing name or cmd starts a new one,
+# PPID, uids and gids can change and stay per sample
+_PROCESS_KEY_FIELDS = ('TID', 'start_epoch', 'name', 'cmd')
+_PROCESS_DIMENSION_FIELDS = (*_PROCESS_KEY_FIELDS, 'TGID', 'is_process', 'VPID', 'CTID', 'CID')
+
+# position of TGID and is_process fields counting from the end of a process line
+_PROCESS_TAIL_POSITIONS = {
+    'PRG': (None, 4),
+    'PRC': (2, 1),
+    'PRM': (3, 2),
+    'PRD': (3, 1),
+    'PRN': (2, 1),
+}
+
+
+def _make_decoder(type_, schema, infer_types, projection=None):
+    '''Make a function converting text of an `atop -P` record (everything after the interval field)
+    into a tuple of type specific values.
+
+    Decoders are generated from field types of `schema`, process names and command lines
+    (the fields in brackets) are located with a fixed plan instead of a regular expression.
+    Types without known field types fall back to guessing them from the first record.
+
+    :param projection: indexes of the fields to return (counting generic fields), all by default
+    '''
 
-        if progress:
-            file = chunk[0][5]
-            if current_file != file:
-                current_file = file
-                current_file_i += 1
-                progress(current_file_i)
+    entry = schema.get(type_) if schema else None
+    if entry is None or None in entry['types']:
+        return _make_guessing_decoder(type_, infer_types, projection)
 
-        by_type = defaultdict(lambda: [])
+    names = [f[0] for f in entry['fields']]
+    types = entry['types'] if infer_types else [str] * len(names)
+    positions = _decoder_positions(names, projection)
 
-        for record in chunk:
-            type_ = record[0]
-            if type_ not in dataframes:
-                if schema:
-                    _ensure_schema(record, schema)
-                dataframes[type_] = []
+    code = ['def decode(text):']
+    code += ['    ' + line for line in _split_statements(type_, names)]
+    code.append(f"    return ({''.join(_DECODER_CASTS[types[i]].format(f'v{i}') + ', ' for i in positions)})")
 
-            by_type[type_].append(record)
+    namespace = {}
+    exec('\n'.join(code), namespace)
+    return namespace['decode']
 
-        for type_, records in by_type.items():
-            dataframes[type_].append(DataFrame.from_records(records))
 
-    for type_, parts in dataframes.items():
-        df = pd.concat(parts)
-        if not schema:
-            extra_vals_len = len(df.columns) - len(GENERIC_FIELDS)
-            columns = list(GENERIC_FIELDS) + [f'val{n}' for n in range(1, extra_vals_len+1)]
+def _make_run_decoder(type_, schema, infer_types, projection=None):
+    '''Make a function converting texts of consecutive `atop -P` records of one type
+    into a list of values per field, see `_make_decoder`.
+
+    Values are appended to the field lists as each text is split, no tuple is built per record.
+    '''
+
+    entry = schema.get(type_) if schema else None
+    if entry is None or None in entry['types']:
+        decode_one = _make_guessing_decoder(type_, infer_types, projection)
+        return lambda texts: [list(values) for values in zip(*map(decode_one, texts))]
+
+    names = [f[0] for f in entry['fields']]
+    types = entry['types'] if infer_types else [str] * len(names)
+    positions = _decoder_positions(names, projection)
+
+    code = ['def decode(texts):']
+    code += [f'    c{i} = []' for i in positions]
+    code += [f'    a{i} = c{i}.append' for i in positions]
+    code.append('    for text in texts:')
+    code += ['        ' + line for line in _split_statements(type_, names)]
+    code += [f"        a{i}({_DECODER_CASTS[types[i]].format(f'v{i}')})" for i in positions]
+    code.append(f"    return [{', '.join(f'c{i}' for i in positions)}]")
+
+    namespace = {}
+    exec('\n'.join(code), namespace)
+    return namespace['decode']
+
+
+_DECODER_CASTS = {int: 'int({})', float: 'float({})', str: '{}', bool: "{} == 'y'"}
+
+
+def _decoder_positions(names, projection):
+    'Positions of the fields a decoder returns, see `_make_decoder`.'
+
+    if projection is None:
+        return range(len(names))
+    return [i - len(GENERIC_FIELDS) for i in projection]
+
+
+def _split_statements(type_, names):
+    'Statements of a generated decoder splitting `text` into fields `v0`, `v1`, ... (as strings).'
+
+    values = [f'v{i}' for i in range(len(names))]
+    if type_ not in _PROCESS_TYPES or names[1] != 'name':
+        return [f"{', '.join(values)}, = text.split()"]
+
+    code = ["pid_end = text.index(' ')"]
+    if 'cmd' in names:
+        cmd = names.index('cmd')
+        code += [
+            "name_end = text.index(') ', pid_end)",
+            f"{', '.join(values[2:cmd])}, rest = text[name_end+2:].split(' ', {cmd - 2})",
+            "cmd_end = rest.rindex(')')",
+            f"{values[cmd]} = rest[1:cmd_end]",
+            f"{', '.join(values[cmd+1:])}, = rest[cmd_end+2:].split()",
+        ]
+    else:
+        code += [
+            "name_end = text.rindex(')')",
+            f"{', '.join(values[2:])}, = text[name_end+2:].split()",
+        ]
+    code += ['v0 = text[:pid_end]', 'v1 = text[pid_end+2:name_end]']
+    return code
+
+
+def _has_atop_types(schema, record_types):
+    'Check if the types of `record_types` in `schema` are the ones of `ATOP_SCHEMA`.'
+
+    from atop_raw import RAW_RECORD_TYPES
+
+    default = parse_atop_schema(ATOP_SCHEMA)
+    if 'ALL' in record_types:
+        record_types = RAW_RECORD_TYPES
+    return bool(schema) and all(
+        t in schema and schema[t]['types'] == default[t]['types'] for t in record_types if t in default)
+
+
+def _make_caster(type_, schema):
+    '''Make a function converting type specific values of a record decoded with `infer_types=False`
+    into the values a decoder from `_make_decoder` returns (types are guessed if `schema` has none).'''
+
+    entry = schema.get(type_) if schema else None
+    types = [] if entry is None or None in entry['types'] else list(entry['types'])
+
+    def cast(vals):
+        if not types:
+            types.extend(_infer_types(vals))
+        return tuple(v == 'y' if typ is bool else typ(v) for typ, v in zip(types, vals))
+
+    return cast
+
+
+def _cast_records(records, schema, casters):
+    '''Yield from `records` (decoded with `infer_types=False`) converting their values,
+    see `_make_caster`.
+
+    :returns: (via StopIteration) return value of `records`
+    '''
+
+    n = len(GENERIC_FIELDS)
+    while True:
+        try:
+            record = next(records)
+        except StopIteration as stop:
+            return stop.value
+        type_ = record[0]
+        cast = casters.get(type_)
+        if cast is None:
+            cast = casters[type_] = _make_caster(type_, schema)
+        yield (type_, int(record[1]), int(record[2]), *record[3:n], *cast(record[n:]))
+
+
+def _make_guessing_decoder(type_, infer_types, projection=None):
+    n = len(GENERIC_FIELDS)
+    positions = None if projection is None else [i - n for i in projection]
+    types = []
+
+    def decode(text):
+        if type_ == 'PRG':
+            pid, name, vals1, cmd, vals2 = _PRG_RECORD_RX.match(text).groups()
+            vals = [pid, name] + vals1.split() + [cmd] + vals2.split()
+        elif type_ in _PROCESS_TYPES:
+            pid, name, vals1 = _PRX_RECORD_RX.match(text).groups()
+            vals = [pid, name] + vals1.split()
         else:
-            columns = list(GENERIC_FIELDS) + [field[0] for field in schema[type_]['fields']]
+            vals = text.split()
 
-        df.columns = columns
-        dataframes[type_] = df
+        if positions is not None:
+            vals = [vals[i] for i in positions]
 
-    return dataframes
+        if not infer_types:
+            return tuple(vals)
 
+        if not types:
+            types.extend(_infer_types(vals))
+        return tuple(typ(val) for typ, val in zip(types, vals))
 
-def to_sqlite(filename, iterator, progress=None, schema='default', use_types=True):
-    '''Create sqlite database from given iterator returned by `iterate_atop_records`.
-    One table per record type.
+    return decode
 
-    :returns: open sqlite connection
+
+def _make_projections(schema, columns):
+    '''Map record type -> indexes of the fields to keep (counting generic fields).'''
+
+    projections = {}
+    for type_, fields in (columns or {}).items():
+        names = [f[0] for f in schema[type_]['fields']]
+        projections[type_] = [len(GENERIC_FIELDS) + names.index(f) for f in fields]
+    return projections
+
+
+def _make_line_filter(time_range, pids, names, processes_only):
+    '''Make a predicate deciding if a raw `atop -P` line is kept looking at as few fields as possible.
+
+    :returns: the predicate or `None` if there is nothing to filter
     '''
 
-    import sqlite3
+    if time_range is None and pids is None and not names and not processes_only:
+        return None
 
-    if schema == 'default':
-        schema = parse_atop_schema(ATOP_SCHEMA)
+    start, end = time_range or (None, None)
+    pids = {str(p) for p in pids} if pids is not None else None
+    names_rx = re.compile('|'.join(f'(?:{n})' for n in names)) if names else None
+    process_filters = pids is not None or names_rx is not None or processes_only
 
-    conn = sqlite3.connect(filename)
-    sql_expr_cache = {}
-    current_file = None
-    current_file_i = -1
+    def keep(line):
+        type_, _, epoch, _, _, _, text = line.split(' ', 6)
 
-    for record in iterator:
-        if progress:
-            file = record[5]
-            if current_file != file:
-                current_file = file
-                current_file_i += 1
-                progress(current_file_i)
+        if time_range is not None:
+            epoch = int(epoch)
+            if (start is not None and epoch < start) or (end is not None and epoch >= end):
+                return False
 
-        type_ = record[0]
-        if type_ not in sql_expr_cache:
+        if not process_filters or type_ not in _PROCESS_TYPES:
+            return True
+
+        pid_end = text.index(' ')
+
+        if type_ == 'PRG':
+            name_end = text.index(') ', pid_end)
+        else:
+            name_end = text.rindex(')')
+
+        tgid_pos, is_process_pos = _PROCESS_TAIL_POSITIONS[type_]
+        tail = text.rsplit(maxsplit=4)
 
-            # create table
+        if processes_only and tail[-is_process_pos] != 'y':
+            return False
 
-            if not schema:
-                extra_vals_len = len(record) - len(GENERIC_FIELDS)
-                extra_fields = [f'val{n}' for n in range(1, extra_vals_len+1)]
+        if pids is not None and text[:pid_end] not in pids:
+            if tgid_pos is None:
+                # state uid gid TGID
+                tgid = text[name_end+2:].split(maxsplit=4)[3]
             else:
-                extra_fields = [field[0] for field in schema[type_]['fields']]
-                _ensure_schema(record, schema)
+                tgid = tail[-tgid_pos]
+            if tgid not in pids:
+                return False
 
-            sql_types = [_SQL_TYPES[type(v)] for v in record]
-            sql_defs = [f'{a} {b}' for a, b in zip((*GENERIC_FIELDS, *extra_fields), sql_types)]
-            sql_defs = ', '.join(sql_defs)
-            conn.execute(f'CREATE TABLE {type_} ({sql_defs})')
+        if names_rx is not None and not names_rx.search(text[pid_end+2:name_end]):
+            return False
 
-            # cache INSERT expression
+        return True
 
-            placeholder = ','.join('?' for _ in range(len(record)))
-            sql_expr_cache[type_] = f'INSERT INTO {type_} VALUES ({placeholder})'
+    return keep
 
-        # insert
-        conn.execute(sql_expr_cache[type_], record)
 
-    conn.commit()
-    return conn
+def _make_record_filter(schema, time_range, pids, names, processes_only):
+    '''Same as `_make_line_filter` but for already decoded records.'''
+
+    if time_range is None and pids is None and not names and not processes_only:
+        return None
+
+    start, end = time_range or (None, None)
+    pids = {int(p) for p in pids} if pids is not None else None
+    names_rx = re.compile('|'.join(f'(?:{n})' for n in names)) if names else None
+
+    positions = {}
+    for type_ in _PROCESS_TYPES:
+        fields = [f[0] for f in schema[type_]['fields']]
+        positions[type_] = [len(GENERIC_FIELDS) + fields.index(f) for f in ('TID', 'name', 'TGID', 'is_process')]
+
+    def keep(record):
+        epoch = int(record[1])
+        if (start is not None and epoch < start) or (end is not None and epoch >= end):
+            return False
+
+        if record[0] not in positions:
+            return True
+
+        tid, name, tgid, is_process = positions[record[0]]
+        if processes_only and record[is_process] not in ('y', True):
+            return False
+        if pids is not None and int(record[tid]) not in pids and int(record[tgid]) not in pids:
+            return False
+        if names_rx is not None and not names_rx.search(record[name]):
+            return False
+        return True
+
+    return keep
+
+
+def _keep_return_value(generator, out):
+    'Yield from given generator and put its return value into `out` list.'
+    out.extend((yield from generator))
+
+
+# samples a worker of the parallel mode hands over at once and chunks it may decode ahead
+# of the reader, see `_iterate_parallel_runs`
+_PARALLEL_CHUNK_SAMPLES = 10
+_PARALLEL_CHUNKS = 4
+
+
+def _iterate_parallel_runs(jobs, workers, stats=None):
+    '''Read files in up to `workers` worker processes, each streaming runs of records
+    (see `_iterate_output_runs`) numbered from zero in chunks of `_PARALLEL_CHUNK_SAMPLES` samples.
+
+    A worker stops once it is `_PARALLEL_CHUNKS` chunks ahead of the reader, so at most about
+    `workers * (_PARALLEL_CHUNKS + 1) * _PARALLEL_CHUNK_SAMPLES` decoded samples are held at once.
+
+    :param jobs: iterable of (path, keyword arguments of `_iterate_file_runs`)
+    :param stats: `AtopStats` stats of the workers (given in the keyword arguments) are merged into
+    :returns: an iterator that yields an iterator of runs per job, in order of `jobs`, which must be
+              exhausted before taking the next one; it returns (via StopIteration) `sample_n`
+              and `boot_n` of the file
+    '''
+
+    import queue
+    import multiprocessing
+    from collections import deque
+
+    context = multiprocessing.get_context()
+    jobs = iter(jobs)
+    pending = deque()
+
+    def start():
+        job = next(jobs, None)
+        if job is not None:
+            chunks = context.Queue(_PARALLEL_CHUNKS)
+            worker = context.Process(target=_stream_file_runs, args=(*job, chunks), daemon=True)
+            worker.start()
+            pending.append((job[0], worker, chunks, []))
+
+    def receive(path, worker, chunks, done):
+        while True:
+            try:
+                kind, *message = chunks.get(timeout=1)
+            except queue.Empty:
+                if not worker.is_alive() and chunks.empty():
+                    raise RuntimeError(f'worker reading {path} exited with code {worker.exitcode}')
+                continue
+
+            if kind == 'runs':
+                yield from message[0]
+            elif kind == 'error':
+                raise message[0]
+            else:
+                sample_n, boot_n, worker_stats = message
+                if stats is not None:
+                    stats.merge(worker_stats)
+                    if stats.callback:
+                        stats.callback(stats)
+                done.append(True)
+                return sample_n, boot_n
+
+    try:
+        for _ in range(workers):
+            start()
+
+        while pending:
+            yield receive(*pending[0])
+            if not pending[0][3]:
+                raise RuntimeError(f'runs of {pending[0][0]} must be read before the next file')
+            _, worker, _, _ = pending.popleft()
+            worker.join()
+            start()
+    finally:
+        for _, worker, _, _ in pending:
+            worker.terminate()
+            worker.join()
+
+
+def _stream_file_runs(path, reader_kw, chunks):
+    '''Worker side of the parallel mode, see `_iterate_parallel_runs`: put ('runs', list of runs)
+    chunks of a file numbered from zero into the `chunks` queue, then ('done', sample_n, boot_n, stats)
+    or ('error', exception).'''
+
+    try:
+        chunk = []
+        samples = 0
+        counters = []
+        for run in _keep_return_value(_iterate_file_runs(path, -1, 0, {}, **reader_kw), counters):
+            if not chunk or run[3] != chunk[-1][3]:
+                if samples == _PARALLEL_CHUNK_SAMPLES:
+                    chunks.put(('runs', chunk))
+                    chunk = []
+                    samples = 0
+                samples += 1
+            chunk.append(run)
+        if chunk:
+            chunks.put(('runs', chunk))
+        chunks.put(('done', *counters, reader_kw.get('stats')))
+    except Exception as e:
+        chunks.put(('error', e))
+
+
+def iterate_live_records(interval=10, samples=None, record_types=('ALL',), binary='atop', by_sample=False,
+                         idle=1.0, buffer_size=10000, infer_types=True, schema='default', pids=None,
+                         names=None, processes_only=False, columns=None):
+    '''Run atop in interval mode (`atop -P <record_types> <interval> [<samples>]`)
+    and iterate through records as samples are taken.
+
+    Records are numbered as in `iterate_atop_records` and `log_file` is set to '-'.
+    Nothing is buffered beyond the current sample (and `buffer_size` lines with `by_sample`):
+    when the consumer is slower than atop, the pipe fills up and atop blocks writing its output.
+    atop is terminated when the iterator is closed.
+
+    :param samples: number of samples to take, `None` to run until the iterator is closed
+    :param by_sample: yield lists of records of one sample instead of single records; a sample
+                      is complete at the next separator or once atop has been quiet for `idle` seconds
+                      (atop prints the separator of a sample only when it is taken)
+    :param buffer_size: maximum number of lines read ahead of the consumer with `by_sample`
+    :returns: an iterator that yields records (or lists of records, see `by_sample`)
+
+    See `iterate_atop_records` for the rest of parameters.
+    '''
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    args = [binary, '-P', ','.join(record_types), str(interval)]
+    if samples is not None:
+        args.append(str(samples))
+
+    keep = _make_line_filter(None, pids, names, processes_only)
+    projections = _make_projections(schema, columns)
+
+    p = Popen(args, stdout=PIPE, encoding='utf8')
+    lines = None
+    try:
+        # same as in a log file, the first sample starts with a 'RESET' line
+        p.stdout.readline()
+
+        if not by_sample:
+            yield from _iterate_output_records(p.stdout, '-', 0, 0, {}, keep, schema, infer_types, projections)
+            return
+
+        lines = _iterate_idle_lines(p.stdout, idle, buffer_size)
+        records = _iterate_output_records(lines, '-', 0, 0, {}, keep, schema, infer_types, projections,
+                                          sample_ends=True)
+        yield from _group_samples(records)
+    finally:
+        if p.poll() is None:
+            p.terminate()
+        if lines is not None:
+            lines.close()
+        p.stdout.close()
+        p.wait()
+
+
+def follow_atop_records(path=None, root='/var/log/atop', poll_interval=10, by_sample=False,
+                        record_types=('ALL',), binary='atop', infer_types=True, backend='atop',
+                        schema='default', pids=None, names=None, processes_only=False, columns=None):
+    '''Follow an atop log being written (by the atop daemon) and iterate through records of new samples.
+
+    The log is checked every `poll_interval` seconds. Records already in the log are yielded first,
+    once it has grown only samples from the minute of the last yielded one on are read
+    (`atop -b`, with the 'raw' backend older samples are skipped without being decompressed)
+    and records past the last yielded epoch are kept. Waits for the log to be created if needed.
+    Runs until the iterator is closed.
+
+    :param path: log file to follow, `None` follows the most recent log in `root` and moves on
+                 to the next one when atop starts a new log, numbering continues across logs
+    :param by_sample: yield lists of records of one sample instead of single records
+    :returns: an iterator that yields records (or lists of records, see `by_sample`)
+
+    See `iterate_atop_records` for the rest of parameters.
+    '''
+
+    import time
+    from itertools import groupby
+    from operator import itemgetter
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    reader_kw = dict(record_types=record_types, binary=binary, infer_types=infer_types, backend=backend,
+                     schema=schema, pids=pids, names=names, processes_only=processes_only, columns=columns)
+
+    def latest_log():
+        if path:
+            return path
+        logs = list_atop_logs(root)
+        return logs[-1] if logs else None
+
+    current = None
+    first_sample_n, first_boot_n = -1, 0
+    # (epoch, sample_n, boot_n) of the last yielded sample
+    last = None
+    last_size = None
+    decoders = {}
+
+    while True:
+        latest = latest_log()
+        current = current or latest
+
+        if current is None or not os.path.exists(current):
+            # atop has not created the log yet
+            time.sleep(poll_interval)
+            continue
+
+        size = os.stat(current).st_size
+        if size == last_size and latest == current:
+            time.sleep(poll_interval)
+            continue
+
+        last_size = size
+        counters = []
+        if last is None:
+            records = _iterate_file_records(current, first_sample_n, first_boot_n, decoders, **reader_kw)
+        else:
+            records = _iterate_file_records(current, -1, 0, decoders, time_range=(last[0], None),
+                                            begin=last[0], **reader_kw)
+            records = _continue_numbering(records, *last)
+        records = _keep_return_value(records, counters)
+
+        if by_sample:
+            for _, sample in groupby(records, itemgetter(3)):
+                sample = list(sample)
+                last = int(sample[-1][1]), sample[-1][3], sample[-1][4]
+                yield sample
+        else:
+            for record in records:
+                last = int(record[1]), record[3], record[4]
+                yield record
+
+        if latest != current:
+            # the rest of the current log has just been read, continue with the next one
+            current = latest
+            first_sample_n, first_boot_n = counters
+            last = None
+            last_size = None
+
+
+def _continue_numbering(records, epoch, sample_n, boot_n):
+    '''Renumber `records` of a log read from some sample on (numbered from zero) so the sample
+    at `epoch`, the first one read, keeps its (`sample_n`, `boot_n`), and drop records up to `epoch`.
+
+    :returns: (via StopIteration) the renumbered return value of `records`
+    '''
+
+    sample_shift = boot_shift = None
+    while True:
+        try:
+            record = next(records)
+        except StopIteration as stop:
+            end_sample_n, end_boot_n = stop.value
+            if sample_shift is None:
+                return sample_n + 1, boot_n
+            return end_sample_n + sample_shift, end_boot_n + boot_shift
+
+        record_epoch = int(record[1])
+        if sample_shift is None:
+            if record_epoch == epoch:
+                sample_shift, boot_shift = sample_n - record[3], boot_n - record[4]
+            else:
+                # the sample is gone (log rewritten), carry on after it
+                sample_shift, boot_shift = sample_n + 1 - record[3], boot_n - record[4]
+
+        if record_epoch > epoch:
+            yield (*record[:3], record[3] + sample_shift, record[4] + boot_shift, *record[5:])
+
+
+def _iterate_idle_lines(stream, idle, buffer_size):
+    'Read lines in a background thread, yield `None` whenever no line arrives within `idle` seconds.'
+
+    import queue
+    import threading
+
+    lines = queue.Queue(buffer_size)
+
+    def read():
+        for line in stream:
+            lines.put(line)
+        lines.put('')
+
+    threading.Thread(target=read, daemon=True).start()
+
+    done = False
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=idle)
+            except queue.Empty:
+                yield None
+                continue
+            if not line:
+                done = True
+                return
+            yield line
+    finally:
+        # unblock the reader thread until it reaches the end of the (terminated) stream
+        while not done:
+            done = not lines.get()
+
+
+def _group_samples(records):
+    'Group records yielded by `_iterate_output_records(..., sample_ends=True)` into lists per sample.'
+
+    sample = []
+    for record in records:
+        if record is not None:
+            sample.append(record)
+        elif sample:
+            yield sample
+            sample = []
+    if sample:
+        yield sample
+
+
+def iterate_atop_batches(files, record_types=('ALL',), binary='atop', infer_types=True,
+                         workers=None, backend='atop', batch_size=10000, schema='default',
+                         time_range=None, pids=None, names=None, processes_only=False, columns=None,
+                         stats=None):
+    '''Iterate through atop records grouped into per type column batches.
+    Same as `iterate_atop_records` but each batch holds up to `batch_size` records
+    of a single type and a single file as columns, ready to be handed to numpy or pandas.
+    See `iterate_atop_records` for filtering parameters and `stats`.
+
+    Records are decoded straight into per field lists of strings (see `_make_run_decoder`)
+    which numpy converts to the field types a whole column at a time.
+
+    :returns: an iterator that yields tuples of (type, columns)
+              where `columns` is a dict of field name -> numpy array,
+              field names are `GENERIC_FIELDS` followed by the fields from `schema`
+              (or val1, val2... if `schema` is None)
+    '''
+
+    import numpy as np
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    reader_kw = dict(record_types=record_types, binary=binary, infer_types=False, backend=backend,
+                     schema=schema, time_range=time_range, pids=pids, names=names,
+                     processes_only=processes_only, columns=columns, stats=stats)
+    runs = _iterate_atop_runs(files, workers, reader_kw)
+    if schema and columns:
+        schema = project_schema(schema, columns)
+
+    # record type -> (epoch, sample_interval, sample_n, boot_n lists, list of type specific columns)
+    pending = {}
+    layouts = {}
+
+    def to_array(col, typ):
+        if typ is bool:
+            return np.array(col) == 'y'
+        return np.array(col, dtype=_NUMPY_TYPES[typ])
+
+    def flush(type_):
+        names, types = layouts[type_]
+        generic, values = pending.pop(type_)
+        size = len(generic[0])
+        columns = [np.full(size, type_, dtype='object'),
+                   *(to_array(col, typ) for col, typ in zip(generic, types[1:5])),
+                   np.full(size, current_file, dtype='object'),
+                   *(to_array(col, typ) for col, typ in zip(values, types[len(GENERIC_FIELDS):]))]
+        return type_, dict(zip(names, columns))
+
+    current_file = None
+
+    for run in runs:
+        type_, epoch, interval, sample_n, boot_n, log_file, size, values = run
+
+        # never let a batch span files so consumers can track progress by `log_file`
+        if log_file != current_file:
+            for pending_type in list(pending):
+                yield flush(pending_type)
+            current_file = log_file
+
+        if type_ not in layouts:
+            record = (*run[:len(GENERIC_FIELDS)], *(col[0] for col in values))
+            n = len(GENERIC_FIELDS)
+            types = None
+            if schema:
+                _ensure_schema(record, schema)
+                names = (*GENERIC_FIELDS, *[f[0] for f in schema[type_]['fields']])
+                if None not in schema[type_]['types']:
+                    types = _GENERIC_FIELDS_TYPES + tuple(schema[type_]['types'])
+            else:
+                names = (*GENERIC_FIELDS, *[f'val{i}' for i in range(1, len(record) - n + 1)])
+            if not infer_types:
+                types = (str,) * len(record)
+            elif types is None:
+                types = _GENERIC_FIELDS_TYPES + _infer_types(record[n:])
+            layouts[type_] = names, types
+
+        # split runs so batches hold at most `batch_size` records
+        start = 0
+        while start < size:
+            if type_ not in pending:
+                pending[type_] = ([], [], [], []), [[] for _ in values]
+            generic, fields = pending[type_]
+            end = min(size, start + batch_size - len(generic[0]))
+            for col, value in zip(generic, (epoch, interval, sample_n, boot_n)):
+                col.extend([value] * (end - start))
+            for col, run_col in zip(fields, values):
+                col.extend(run_col if start == 0 and end == size else run_col[start:end])
+            start = end
+            if len(generic[0]) >= batch_size:
+                yield flush(type_)
+
+    for type_ in list(pending):
+        yield flush(type_)
+
+
+def _iterate_atop_runs(files, workers, reader_kw):
+    '''Same as `iterate_atop_records` but yields runs of records, see `_iterate_output_runs`.'''
+
+    boot_n = 0
+    sample_n = -1
+
+    if workers is not None and workers > 1:
+        # workers collect into their own stats, merged once a file is done
+        stats = reader_kw['stats']
+        if stats is not None:
+            reader_kw = dict(reader_kw, stats=AtopStats())
+
+        for runs in _iterate_parallel_runs(((path, reader_kw) for path in files), workers, stats):
+            # worker numbering starts at (-1, 0), shift it to continue the global one
+            sample_n, boot_n = yield from _shift_runs(runs, sample_n + 1, boot_n)
+        return
+
+    decoders = {}
+
+    for path in files:
+        sample_n, boot_n = yield from _iterate_file_runs(path, sample_n, boot_n, decoders, **reader_kw)
+
+
+def merge_process_records(records, record_types=('PRG', 'PRC', 'PRM', 'PRD'), schema='default'):
+    '''Join per process records of different types into one 'PS' record per process and sample.
+
+    Records are joined on (sample_n, TID) as they arrive, only one sample is kept in memory.
+    A process is only yielded when all `record_types` have a record for it, a TID occurring
+    several times within a sample is matched by order of occurrence. Records of other types
+    are passed through as they are, 'PS' records of a sample follow them (they are yielded
+    once the sample is complete) and come before any record of the next sample.
+
+    :param records: iterator returned by `iterate_atop_records` (with at least `record_types`)
+    :param schema: schema the records were read with, see `merge_process_schema` to describe the result
+    :returns: an iterator that yields tuples of values: tuple(*generic_fields, *merged_fields)
+    '''
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    n = len(GENERIC_FIELDS)
+    tid_positions = {}
+    positions = {}
+    seen = set()
+    for type_ in record_types:
+        names = [f[0] for f in schema[type_]['fields']]
+        if 'TID' not in names:
+            raise ValueError(f'records of type {type_} must have the TID field to be merged')
+        tid_positions[type_] = n + names.index('TID')
+        positions[type_] = [n + i for i, name in enumerate(names) if name not in seen]
+        seen.update(names)
+
+    first_type, *other_types = record_types
+
+    def merge():
+        for record in first:
+            tid = record[tid_positions[first_type]]
+            matches = [by_tid[type_].get(tid) for type_ in other_types]
+            if not all(matches):
+                continue
+
+            merged = ['PS', *record[1:n], *(record[i] for i in positions[first_type])]
+            for type_, match in zip(other_types, matches):
+                other = match.pop(0)
+                merged.extend(other[i] for i in positions[type_])
+            yield tuple(merged)
+
+    current_sample = None
+    first = []
+    by_tid = {type_: defaultdict(list) for type_ in other_types}
+
+    for record in records:
+        # merged records of a sample come out before any record of the next one
+        if record[3] != current_sample:
+            yield from merge()
+            current_sample = record[3]
+            first = []
+            by_tid = {type_: defaultdict(list) for type_ in other_types}
+
+        type_ = record[0]
+        if type_ not in positions:
+            yield record
+            continue
+
+        if type_ == first_type:
+            first.append(record)
+        else:
+            by_tid[type_][record[tid_positions[type_]]].append(record)
+
+    yield from merge()
+
+
+def split_process_records(records, schema='default'):
+    '''Split PRG records into a process dimension and slim per sample records.
+
+    A 'PROCESS' record with the static fields (TID, start_epoch, name, cmd, TGID, is_process, VPID,
+    CTID, CID) is yielded the first time a process is seen, processes are told apart by boot_n, TID,
+    start_epoch, name and cmd. A process replacing its program (exec) or rewriting its command line
+    (setproctitle) gets another PROCESS record from the sample the change is seen in. PRG records are
+    reduced to the id of that process, TID and the other fields, including PPID, uids and gids which
+    can change during the life of a process. Ids are kept in an in-memory cache and are only unique
+    within one call. Records of other types are passed through.
+
+    :param records: iterator returned by `iterate_atop_records`
+    :param schema: schema the records were read with, see `split_process_schema` to describe the result
+    :returns: an iterator that yields tuples of values: tuple(*generic_fields, process_id, *fields)
+    '''
+
+    from operator import itemgetter
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    n = len(GENERIC_FIELDS)
+    dimension, keys, facts = _split_process_positions(schema['PRG'])
+    facts = [n + i for i in dimension[:1] + facts]
+    dimension = [n + i for i in dimension]
+    key = itemgetter(4, *dimension[:keys])
+
+    ids = {}
+    for record in records:
+        if record[0] != 'PRG':
+            yield record
+            continue
+
+        key_values = key(record)
+        process_id = ids.get(key_values)
+        if process_id is None:
+            process_id = ids[key_values] = len(ids)
+            yield ('PROCESS', *record[1:n], process_id, *(record[i] for i in dimension))
+        yield ('PRG', *record[1:n], process_id, *(record[i] for i in facts))
+
+
+def _split_process_batches(batches, schema):
+    'Same as `split_process_records` for batches yielded by `iterate_atop_batches`.'
+
+    import numpy as np
+
+    dimension, keys, facts = _split_process_positions(schema['PRG'])
+    names = [f[0] for f in schema['PRG']['fields']]
+    dimension = [names[i] for i in dimension]
+    facts = [dimension[0], *(names[i] for i in facts)]
+
+    ids = {}
+    for type_, columns in batches:
+        if type_ != 'PRG':
+            yield type_, columns
+            continue
+
+        key_values = list(zip(columns['boot_n'].tolist(), *(columns[f].tolist() for f in dimension[:keys])))
+        process_ids = np.empty(len(key_values), dtype='int64')
+        first_seen = []
+        for i, key in enumerate(key_values):
+            process_id = ids.get(key)
+            if process_id is None:
+                process_id = ids[key] = len(ids)
+                first_seen.append(i)
+            process_ids[i] = process_id
+
+        if first_seen:
+            yield 'PROCESS', {'type': np.full(len(first_seen), 'PROCESS', dtype='object'),
+                              **{f: columns[f][first_seen] for f in GENERIC_FIELDS[1:]},
+                              'process_id': process_ids[first_seen],
+                              **{f: columns[f][first_seen] for f in dimension}}
+        yield 'PRG', {**{f: columns[f] for f in GENERIC_FIELDS},
+                      'process_id': process_ids,
+                      **{f: columns[f] for f in facts}}
+
+
+def _infer_types(vals):
+    'Guess types of type specific values of a record.'
+    types = []
+    for v in vals:
+        if re.match(r'^-?\d+(\.\d+)?$', v):
+            types.append(float)
+        else:
+            types.append(str)
+    return tuple(types)
+
+
+def _ensure_schema(full_record, schema):
+    fields = (*GENERIC_FIELDS, *[f[0] for f in schema[full_record[0]]['fields']])
+    assert len(full_record) == len(fields), (
+        'number of fields in the schema does not match number of values in the record; '
+        f'expected fields: {fields}; values: {full_record}')
+
+
+def to_pandas(iterator, progress=None, schema='default', compact=False, rollups=None, stats=None,
+              split_processes=False):
+    '''Create pandas datafeame from given iterator returned by `iterate_atop_records`
+    or `iterate_atop_batches`. One table per record type.
+
+    :param compact: build memory compact dataframes: low cardinality strings become categoricals,
+                    repeated strings share a single object, integers and floats are downcast
+                    to the smallest dtype that fits; frames are assembled column by column
+                    instead of concatenating chunks. Note that arithmetic keeps downcast dtypes
+                    (int8 + int8 may overflow), use `.astype('int64')` first where it matters
+    :param rollups: optional resolutions (e.g. ('1m', '10m', '1h')) to also aggregate every type into,
+                    see `rollup_frames`
+    :param stats: optional `AtopStats` to add time spent building dataframes to (the pandas timer)
+    :param split_processes: split PRG into a PROCESS dimension and slim per sample PRG records,
+                            see `split_process_records`
+    :returns: dictionary of dataframes
+    '''
+
+    import pandas as pd
+    from pandas import DataFrame
+
+    if stats is not None:
+        from time import perf_counter
+
+        start = perf_counter()
+        source = _TimedIterator(iterator)
+        dataframes = to_pandas(source, progress, schema, compact, rollups, split_processes=split_processes)
+        stats.timers['pandas'] += perf_counter() - start - source.seconds
+        stats.counters['rows.pandas'] += sum(len(df) for df in dataframes.values())
+        return dataframes
+
+    if rollups:
+        dataframes = to_pandas(iterator, progress, schema, compact, split_processes=split_processes)
+        dataframes.update(rollup_frames(dataframes, rollups, schema))
+        return dataframes
+
+    iterator = iter(iterator)
+    first = next(iterator, None)
+    if first is None:
+        return {}
+    iterator = chain([first], iterator)
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    if isinstance(first[1], dict):
+        if split_processes:
+            iterator = _split_process_batches(iterator, schema)
+        return _batches_to_pandas(iterator, progress, compact)
+
+    if split_processes:
+        iterator = split_process_records(iterator, schema)
+        schema = split_process_schema(schema)
+
+    if compact:
+        return _batches_to_pandas(_records_to_batches(iterator, schema), progress, compact)
+
+    current_file = None
+    current_file_i = -1
+
+    chunksize = 10000
+
+    dataframes = {}
+
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            break
+
+        if progress:
+            file = chunk[0][5]
+            if current_file != file:
+                current_file = file
+                current_file_i += 1
+                progress(current_file_i)
+
+        by_type = defaultdict(lambda: [])
+
+        for record in chunk:
+            type_ = record[0]
+            if type_ not in dataframes:
+                if schema:
+                    _ensure_schema(record, schema)
+                dataframes[type_] = []
+
+            by_type[type_].append(record)
+
+        for type_, records in by_type.items():
+            dataframes[type_].append(DataFrame.from_records(records))
+
+    for type_, parts in dataframes.items():
+        df = pd.concat(parts)
+        if not schema:
+            extra_vals_len = len(df.columns) - len(GENERIC_FIELDS)
+            columns = list(GENERIC_FIELDS) + [f'val{n}' for n in range(1, extra_vals_len+1)]
+        else:
+            columns = list(GENERIC_FIELDS) + [field[0] for field in schema[type_]['fields']]
+
+        df.columns = columns
+        dataframes[type_] = df
+
+    return dataframes
+
+
+def _records_to_batches(iterator, schema, chunksize=10000):
+    'Group records into column batches like the ones yielded by `iterate_atop_batches`.'
+
+    import numpy as np
+
+    names = {}
+
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            break
+
+        by_type = defaultdict(list)
+        for record in chunk:
+            by_type[record[0]].append(record)
+        del chunk
+
+        for type_, records in by_type.items():
+            if type_ not in names:
+                if schema:
+                    _ensure_schema(records[0], schema)
+                    names[type_] = (*GENERIC_FIELDS, *[f[0] for f in schema[type_]['fields']])
+                else:
+                    extra_vals_len = len(records[0]) - len(GENERIC_FIELDS)
+                    names[type_] = (*GENERIC_FIELDS, *[f'val{n}' for n in range(1, extra_vals_len+1)])
+
+            columns = {}
+            for name, col in zip(names[type_], zip(*records)):
+                columns[name] = np.array(col, dtype=_NUMPY_TYPES.get(type(col[0]), 'object'))
+            yield type_, columns
+
+
+def _batches_to_pandas(iterator, progress, compact=False):
+    import numpy as np
+    from pandas import DataFrame
+
+    current_file = None
+    current_file_i = -1
+
+    batches = defaultdict(list)
+
+    for type_, columns in iterator:
+        if progress:
+            file = columns['log_file'][0]
+            if current_file != file:
+                current_file = file
+                current_file_i += 1
+                progress(current_file_i)
+
+        batches[type_].append(columns)
+
+    # concatenate each column once instead of concatenating whole frames,
+    # parts are released column by column to keep the peak memory low
+    dataframes = {}
+    for type_, parts in batches.items():
+        columns = {}
+        for name in list(parts[0]):
+            col = np.concatenate([p.pop(name) for p in parts])
+            columns[name] = _compact_column(col) if compact else col
+        del parts[:]
+        dataframes[type_] = DataFrame(columns, copy=False)
+
+    return dataframes
+
+
+def _compact_column(values):
+    '''Convert numpy array into the smallest suitable representation, see `to_pandas(compact=True)`.'''
+
+    import numpy as np
+    import pandas as pd
+
+    kind = values.dtype.kind
+    if kind in 'iu':
+        return pd.to_numeric(values, downcast='integer')
+    if kind == 'f':
+        return pd.to_numeric(values, downcast='float')
+    if kind == 'O':
+        codes, uniques = pd.factorize(values)
+        if len(uniques) <= len(values) // 2:
+            return pd.Categorical.from_codes(codes, uniques)
+        # point all repeated strings to the same object
+        return np.asarray(uniques, dtype=object)[codes]
+    return values
+
+
+def derive_metrics(frames, schema='default', max_interval_deviation=None):
+    '''Add rates and utilization percentages to dataframes returned by `to_pandas` or `read_pandas`.
+
+    Columns are added for every field with a unit in `schema` (see `parse_atop_schema`),
+    computed over whole columns at once:
+    - ticks: `<field>_pct`, percentage of one CPU as shown by atop (`cpu_tot * sample_interval`
+      clock-ticks is 100%) and `<field>_util`, percentage of all processors (0-100), for types
+      without `processors` field (PRC) it is taken from CPU records of the same sample if given
+    - ms: `<field>_pct`, percentage of the interval spent (e.g. disk busy time)
+    - count: `<field>_rate`, per second
+
+    :param frames: dictionary of dataframes
+    :param max_interval_deviation: drop samples with `sample_interval` that differs from the median
+                                   interval by this many seconds or more (first sample after a boot,
+                                   suspended machine and alike)
+    :returns: dictionary of new dataframes
+    '''
+
+    import numpy as np
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    processors = None
+    if 'CPU' in frames and 'processors' in frames['CPU']:
+        cpu = frames['CPU'].drop_duplicates('sample_n')
+        processors = cpu.set_index('sample_n')['processors']
+
+    derived = {}
+    for type_, df in frames.items():
+        if max_interval_deviation is not None:
+            interval = df['sample_interval']
+            df = df[(interval - interval.median()).abs() < max_interval_deviation]
+
+        type_processors = None
+        if processors is not None and 'processors' not in df:
+            type_processors = np.asarray(df['sample_n'].map(processors), dtype='float64')
+
+        df = df.copy()
+        for name, values in _derive_columns(df, schema[type_], type_processors).items():
+            df[name] = values
+        derived[type_] = df
+
+    return derived
+
+
+def derive_batch_metrics(batches, schema='default'):
+    '''Add rates and utilization percentages to batches yielded by `iterate_atop_batches`.
+    Same as `derive_metrics` except that processors count is only known to types having it.
+
+    :returns: an iterator that yields tuples of (record type, dict of column -> numpy array)
+    '''
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    for type_, columns in batches:
+        columns.update(_derive_columns(columns, schema[type_]))
+        yield type_, columns
+
+
+def _derive_columns(columns, entry, processors=None):
+    '''Compute derived columns of a single record type, see `derive_metrics`.
+
+    :param columns: dataframe or dict of column -> numpy array
+    :param processors: optional array with number of processors for each row
+    :returns: dict of column -> numpy array
+    '''
+
+    import numpy as np
+
+    interval = np.asarray(columns['sample_interval'], dtype='float64')
+    interval = np.where(interval > 0, interval, np.nan)
+
+    if 'processors' in columns:
+        processors = np.asarray(columns['processors'], dtype='float64')
+
+    ticks = None
+    derived = {}
+    for (name, *_), unit in zip(entry['fields'], entry['units']):
+        if unit is None or name not in columns:
+            continue
+
+        values = np.asarray(columns[name], dtype='float64')
+        if unit == 'count':
+            derived[f'{name}_rate'] = values / interval
+        elif unit == 'ms':
+            derived[f'{name}_pct'] = values / interval / 10
+        elif unit == 'ticks':
+            if ticks is None:
+                if 'cpu_tot' not in columns:
+                    raise ValueError(f'cpu_tot field is needed to compute percentages of {name}')
+                ticks = np.asarray(columns['cpu_tot'], dtype='float64') * interval / 100
+            derived[f'{name}_pct'] = pct = values / ticks
+            if processors is not None:
+                derived[f'{name}_util'] = pct / processors
+
+    return derived
+
+
+# default keys rollups are grouped by, besides time
+_ROLLUP_KEYS = {
+    'CPU_N': ('proc_n',),
+    'LVM': ('name',),
+    'MDD': ('name',),
+    'DSK': ('name',),
+    'NFM': ('name',),
+    'NET_IF': ('name',),
+    'PRG': ('name',),
+    'PRC': ('name',),
+    'PRM': ('name',),
+    'PRD': ('name',),
+    'PRN': ('name',),
+    'PS': ('name',),
+}
+
+_CPU_TICKS = ('cpu_sys', 'cpu_usr', 'cpu_niced', 'cpu_idle', 'cpu_wait', 'cpu_irq', 'cpu_softirq',
+              'cpu_steal', 'cpu_guest')
+_DISK_COUNTERS = ('ms_spent', 'reads', 'reads_sectors', 'writes', 'writes_sectors')
+_PROCESS_ROLLUP_FIELDS = {
+    'PRG': (('threads', 'threads_running', 'threads_sleeping', 'threads_sleeping_d'), ()),
+    'PRC': ((), ('cpu_usr', 'cpu_sys')),
+    'PRM': (('mem_virt_size', 'mem_res_size', 'mem_shared_size', 'vlib_exec_size', 'vlib_data_size',
+             'vlib_stack_size', 'swap', 'prop_set_size'),
+            ('mem_virt_growth', 'mem_res_growth', 'pagefaults_minor', 'pagefaults_major')),
+    'PRD': ((), ('reads', 'reads_sectors_cum', 'writes', 'writes_sectors_cum', 'cncl_sectors')),
+    'PRN': ((), ('tcp_snt', 'tcp_snt_cum', 'tcp_rcv', 'tcp_rcv_cum', 'udp_snt', 'udp_snt_cum',
+                 'udp_rcv', 'udp_rcv_cum')),
+}
+
+# default (gauges, counters) fields rollups aggregate, gauges are levels seen at the end of a sample
+# (sizes, load averages, thread counts) and get mean, max and p95, counters are amounts within
+# the sample interval (ticks, I/O, packets, faults) and get the sum too,
+# identifiers and machine constants (TID, page_size, cpu_tot, ...) are left out
+_ROLLUP_FIELDS = {
+    'CPU': (('freq', 'freq_pct'), _CPU_TICKS),
+    'CPU_N': (('freq', 'freq_prc'), _CPU_TICKS),
+    'CPL': (('load_avg1', 'load_avg5', 'load_avg15'), ('ctx_switches', 'interrupts')),
+    'MEM': (('size_phys', 'size_free', 'size_cache', 'size_buf', 'size_slab', 'size_cache_dirty',
+             'size_slab_recl', 'size_vmware_balloon', 'size_shared_tot', 'size_shared_res',
+             'size_shared_swp', 'size_huge_tot', 'size_huge_free'), ()),
+    'SWP': (('size_swp', 'size_free', 'size_committed', 'committed_limit'), ()),
+    'PAG': ((), ('pg_scans', 'allocstalls', 'swapins', 'swapouts')),
+    'LVM': ((), _DISK_COUNTERS),
+    'MDD': ((), _DISK_COUNTERS),
+    'DSK': ((), _DISK_COUNTERS),
+    'NFM': ((), ('bytes_read', 'bytes_write', 'bytes_r_normal', 'bytes_w_normal', 'bytes_r_directio',
+                 'bytes_w_directio', 'pages_read', 'pages_write')),
+    'NFC': ((), ('rpcs', 'rpcs_read', 'rpcs_write', 'rpcs_re', 'auth_re')),
+    'NFS': ((), ('rpcs', 'rpcs_r', 'rpcs_w', 'clientbytes_r', 'clientbytes_w', 'rpcs_bad_fmt',
+                 'rpcs_bad_auth', 'rpcs_bad_client', 'tot_rq', 'rq_tcp', 'rq_udp', 'conn_tcp',
+                 'repcache_hits', 'repcache_miss', 'uncashed_rq')),
+    'NET': ((), ('tcp_rcv', 'tcp_snt', 'udp_rcv', 'udp_snt', 'ip_rcv', 'ip_snt', 'ip_delivered', 'op_fwd')),
+    'NET_IF': ((), ('packets_rcv', 'bytes_rcv', 'packets_snt', 'bytes_snt')),
+    **_PROCESS_ROLLUP_FIELDS,
+    # see `merge_process_records`
+    'PS': tuple(tuple(f for fields in _PROCESS_ROLLUP_FIELDS.values() for f in fields[i]) for i in (0, 1)),
+}
+
+# per process types also have a record per thread, only the ones of whole processes are aggregated
+_ROLLUP_PROCESS_TYPES = (*_PROCESS_ROLLUP_FIELDS, 'PS')
+
+_ROLLUP_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def rollup_frames(frames, resolutions=('1m', '10m', '1h'), schema='default', keys=None, fields=None):
+    '''Aggregate dataframes returned by `to_pandas` into fixed time buckets.
+
+    Every (record type, resolution) gives a dataframe named `<type>_<resolution>` (e.g. DSK_10m)
+    with one row per bucket and key: `bucket` (epoch of the bucket start), the key columns,
+    `rows` (number of aggregated records), `<field>_mean`, `<field>_max`, `<field>_p95` for every
+    gauge and `<field>_sum`, `<field>_mean`, `<field>_max`, `<field>_p95` for every counter.
+    Per process types only aggregate records of whole processes (is_process), threads would count
+    twice otherwise, so a PRG split by `split_process_records` is not aggregated.
+
+    :param resolutions: bucket sizes as a number followed by s, m, h or d
+    :param keys: optional dict of record type -> columns to group by besides time,
+                 defaults to the names of disks, interfaces, processes and alike (see `_ROLLUP_KEYS`),
+                 a `host` column is always added when present
+    :param fields: optional dict of record type -> (gauges, counters) to aggregate, defaults to
+                   `_ROLLUP_FIELDS`, the fields with a unit in `schema` for other types
+    :returns: dictionary of dataframes
+    '''
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    rollups = {}
+    for type_, df in frames.items():
+        entry = schema.get(type_) if schema else None
+        if entry is None and schema:
+            # not a record type (e.g. an already computed rollup)
+            continue
+        type_keys = _rollup_keys(type_, df, keys)
+        gauges, counters = _rollup_fields(type_, entry, df, type_keys, fields)
+        if not gauges and not counters:
+            continue
+        if type_ in _ROLLUP_PROCESS_TYPES:
+            if 'is_process' not in df:
+                continue
+            df = df[df['is_process'].astype(bool)]
+        for resolution in resolutions:
+            seconds = _parse_resolution(resolution)
+            rollups[f'{type_}_{resolution}'] = _rollup_frame(df, seconds, type_keys, gauges, counters)
+    return rollups
+
+
+def update_sqlite_rollups(conn, resolutions=('1m', '10m', '1h'), schema='default', keys=None, fields=None):
+    '''Create or update rollup tables of a sqlite database made by `to_sqlite` (or its variants).
+    Requires pandas.
+
+    Tables are the same as the dataframes of `rollup_frames` (`<type>_<resolution>`). Last aggregated
+    rowid of every rollup is kept in the `atop_rollups` table so only records inserted since the last
+    update are aggregated and merged into the existing buckets (rows and sums are added up, maxima
+    compared, means weighted by rows). The 95th percentile can't be merged, it is recomputed
+    from the records of the buckets that already had rows, usually just the last one.
+
+    :param conn: open sqlite connection
+    :returns: `conn`
+    '''
+
+    import pandas as pd
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    conn.execute('CREATE TABLE IF NOT EXISTS atop_rollups (name TEXT, last_rowid INT, PRIMARY KEY (name))')
+    state = dict(conn.execute('SELECT name, last_rowid FROM atop_rollups'))
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    for type_, entry in schema.items():
+        if type_ not in tables:
+            continue
+
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({type_})')]
+        type_keys = _rollup_keys(type_, columns, keys)
+        gauges, counters = _rollup_fields(type_, entry, columns, type_keys, fields)
+        if not gauges and not counters:
+            continue
+        # records to aggregate, a condition on rowid or epoch follows
+        query = f'SELECT {", ".join(["epoch", *type_keys, *gauges, *counters])} FROM {type_} WHERE '
+        if type_ in _ROLLUP_PROCESS_TYPES:
+            if 'is_process' not in columns:
+                continue
+            query += 'is_process AND '
+        max_rowid = conn.execute(f'SELECT max(rowid) FROM {type_}').fetchone()[0] or 0
+
+        for resolution in resolutions:
+            name = f'{type_}_{resolution}'
+            last_rowid = state.get(name, 0)
+            if max_rowid <= last_rowid:
+                continue
+
+            seconds = _parse_resolution(resolution)
+            df = pd.read_sql(query + 'rowid > ? AND rowid <= ?', conn, params=(last_rowid, max_rowid))
+            rollup = _rollup_frame(df, seconds, type_keys, gauges, counters)
+
+            if name in tables:
+                rollup = _merge_sqlite_rollup(conn, name, rollup, seconds, query, type_keys, gauges, counters)
+
+            rollup.to_sql(name, conn, if_exists='append', index=False)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_bucket ON {name} (bucket)')
+            conn.execute('INSERT OR REPLACE INTO atop_rollups VALUES (?, ?)', (name, max_rowid))
+
+    conn.commit()
+    return conn
+
+
+def _merge_sqlite_rollup(conn, name, rollup, seconds, query, keys, gauges, counters):
+    '''Merge `rollup` of new records with the rows of table `name` in the same buckets.
+    Rows of those buckets are deleted from the table.
+
+    :param query: select of the aggregated records, see `update_sqlite_rollups`
+
+    :returns: rollup rows to append to the table
+    '''
+
+    import pandas as pd
+
+    # sqlite limits the number of parameters, delete and read existing buckets in chunks
+    buckets = [int(b) for b in rollup['bucket'].unique()]
+    existing = []
+    for i in range(0, len(buckets), 500):
+        chunk = buckets[i:i + 500]
+        where = f'bucket IN ({", ".join("?" * len(chunk))})'
+        existing.append(pd.read_sql(f'SELECT * FROM {name} WHERE {where}', conn, params=chunk))
+        conn.execute(f'DELETE FROM {name} WHERE {where}', chunk)
+    existing = pd.concat(existing, ignore_index=True)
+    if existing.empty:
+        return rollup
+
+    on = ['bucket', *keys]
+    merged = rollup.merge(existing, on=on, how='outer', suffixes=('', '_old'), indicator=True)
+    both = merged['_merge'] == 'both'
+    old_only = merged['_merge'] == 'right_only'
+
+    fields = [*gauges, *counters]
+    for column in ['rows', *_rollup_columns(gauges, counters)]:
+        merged.loc[old_only, column] = merged.loc[old_only, f'{column}_old']
+    rows, rows_old = merged.loc[both, 'rows'], merged.loc[both, 'rows_old']
+    merged.loc[both, 'rows'] = rows + rows_old
+    for f in fields:
+        merged.loc[both, f'{f}_max'] = merged.loc[both, [f'{f}_max', f'{f}_max_old']].max(axis=1)
+        merged.loc[both, f'{f}_mean'] = ((merged.loc[both, f'{f}_mean'] * rows
+                                          + merged.loc[both, f'{f}_mean_old'] * rows_old) / (rows + rows_old))
+    for f in counters:
+        merged.loc[both, f'{f}_sum'] += merged.loc[both, f'{f}_sum_old']
+
+    if both.any():
+        # percentiles of buckets with old and new records need all of their records
+        p95 = []
+        for bucket in merged.loc[both, 'bucket'].unique():
+            df = pd.read_sql(query + 'epoch >= ? AND epoch < ?', conn, params=(int(bucket), int(bucket) + seconds))
+            p95.append(_rollup_frame(df, seconds, keys, gauges, counters))
+        p95 = pd.concat(p95, ignore_index=True).set_index(on)[[f'{f}_p95' for f in fields]]
+        index = pd.MultiIndex.from_frame(merged.loc[both, on]) if keys else merged.loc[both, 'bucket']
+        for f in fields:
+            merged.loc[both, f'{f}_p95'] = p95[f'{f}_p95'].reindex(index).to_numpy()
+
+    return merged[rollup.columns].astype({'bucket': 'int64', 'rows': 'int64'})
+
+
+def _parse_resolution(resolution):
+    'Convert resolution like 10m into seconds.'
+
+    number, unit = resolution[:-1], resolution[-1:]
+    if unit not in _ROLLUP_UNITS or not number.isdigit():
+        raise ValueError(f'bad rollup resolution: {resolution!r}')
+    return int(number) * _ROLLUP_UNITS[unit]
+
+
+def _rollup_keys(type_, columns, keys):
+    type_keys = (keys or {}).get(type_, _ROLLUP_KEYS.get(type_, ()))
+    if 'host' in columns and 'host' not in type_keys:
+        type_keys = ('host', *type_keys)
+    return [k for k in type_keys if k in columns]
+
+
+def _rollup_fields(type_, entry, columns, keys, fields):
+    'Gauges and counters of a type to aggregate, see `_ROLLUP_FIELDS`.'
+
+    if fields and type_ in fields:
+        gauges, counters = fields[type_]
+        return list(gauges), list(counters)
+
+    if type_ in _ROLLUP_FIELDS:
+        gauges, counters = _ROLLUP_FIELDS[type_]
+    elif entry is None:
+        # no schema, aggregate whatever is numeric
+        gauges, counters = (), [c for c in columns if c not in GENERIC_FIELDS and columns[c].dtype.kind in 'iuf']
+    else:
+        gauges, counters = (), [f[0] for f, unit in zip(entry['fields'], entry['units']) if unit]
+    return ([f for f in gauges if f in columns and f not in keys],
+            [f for f in counters if f in columns and f not in keys])
+
+
+def _rollup_columns(gauges, counters):
+    return [*[f'{f}_{s}' for f in gauges for s in ('mean', 'max', 'p95')],
+            *[f'{f}_{s}' for f in counters for s in ('sum', 'mean', 'max', 'p95')]]
+
+
+def _rollup_frame(df, seconds, keys, gauges, counters):
+    'Aggregate a single dataframe into buckets of `seconds`, see `rollup_frames`.'
+
+    import pandas as pd
+
+    fields = [*gauges, *counters]
+    bucket = (df['epoch'].astype('int64') // seconds * seconds).rename('bucket')
+    # sums of downcast (see `to_pandas(compact=True)`) columns must not overflow
+    values = df[fields].astype({f: 'int64' for f in fields if df[f].dtype.kind in 'iub'})
+    grouped = values.groupby([bucket, *[df[k] for k in keys]], sort=True, observed=True)
+
+    stats = grouped.agg(['sum', 'mean', 'max'])
+    stats.columns = [f'{field}_{stat}' for field, stat in stats.columns]
+    p95 = grouped.quantile(.95)
+    p95.columns = [f'{field}_p95' for field in p95.columns]
+
+    rollup = pd.concat([grouped.size().rename('rows'), stats, p95], axis=1)
+    rollup = rollup[['rows', *_rollup_columns(gauges, counters)]]
+    return rollup.reset_index()
+
+
+def read_pandas(files, record_types=('ALL',), binary='atop', backend='atop', progress=None,
+                schema='default', cache_dir=None, columns=None, cache_size=None, compact=False,
+                lazy=False, workers=None):
+    '''Read given atop logs into pandas dataframes, optionally caching them on disk.
+    One table per record type, same as `to_pandas(iterate_atop_records(files, record_types))`.
+
+    With `cache_dir` every (log file, record type) is stored as a parquet file (requires pyarrow
+    or fastparquet) and next calls only run atop for files and record types not cached yet.
+    An entry is invalidated when size or mtime of its log file or the schema changes.
+
+    :param columns: optional dict of record type -> list of columns to load
+    :param cache_size: limit of the cache directory size in bytes,
+                       least recently used log files are evicted first
+    :param compact: build memory compact dataframes, see `to_pandas`
+    :param lazy: return `LazyFrames` reading every record type on first access instead of all at once
+    :param workers: number of worker processes `LazyFrames.load` reads pending record types with
+    :returns: dictionary of dataframes
+    '''
+
+    import pandas as pd
+
+    if lazy:
+        from functools import partial
+
+        types_schema = parse_atop_schema(ATOP_SCHEMA) if schema in ('default', None) else schema
+        types = [t for t in types_schema if 'ALL' in record_types or _record_label(t) in record_types]
+        read = partial(read_pandas, files, binary=binary, backend=backend, schema=schema,
+                       cache_dir=cache_dir, columns=columns, cache_size=cache_size, compact=compact)
+        return LazyFrames(types, read, workers)
+
+    if not cache_dir:
+        iterator = iterate_atop_records(files, record_types, binary, backend=backend)
+        dataframes = to_pandas(iterator, progress=progress, schema=schema, compact=compact)
+        if columns:
+            dataframes = {t: (df[columns[t]] if t in columns else df) for t, df in dataframes.items()}
+        return dataframes
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    import json
+    import hashlib
+
+    os.makedirs(cache_dir, exist_ok=True)
+    schema_json = json.dumps([GENERIC_FIELDS, schema], default=lambda typ: typ.__name__)
+    schema_hash = hashlib.sha1(schema_json.encode()).hexdigest()
+    columns = columns or {}
+
+    boot_n = 0
+    sample_n = -1
+
+    parts = defaultdict(list)
+    used = set()
+
+    for i, path in enumerate(files):
+        if progress:
+            progress(i)
+
+        entry_dir, meta = _cached_log(cache_dir, path, record_types, binary, backend, schema, schema_hash)
+        used.add(entry_dir)
+
+        # cached numbering starts at (-1, 0), shift it to continue the numbering of previous files
+        sample_shift = sample_n + 1
+        boot_shift = boot_n
+
+        for type_ in meta['types']:
+            if 'ALL' not in record_types and _record_label(type_) not in record_types:
+                continue
+            df = pd.read_parquet(os.path.join(entry_dir, f'{type_}.parquet'), columns=columns.get(type_))
+            if 'sample_n' in df:
+                df['sample_n'] += sample_shift
+            if 'boot_n' in df:
+                df['boot_n'] += boot_shift
+            parts[type_].append(df)
+
+        sample_n = meta['sample_n'] + sample_shift
+        boot_n = meta['boot_n'] + boot_shift
+
+    if cache_size is not None:
+        _evict_cache(cache_dir, cache_size, keep=used)
+
+    dataframes = {type_: pd.concat(dfs, ignore_index=True) for type_, dfs in parts.items()}
+    if compact:
+        for type_, df in dataframes.items():
+            dataframes[type_] = pd.DataFrame({c: _compact_column(df[c].to_numpy()) for c in df.columns},
+                                             copy=False)
+    return dataframes
+
+
+class LazyFrames(Mapping):
+    '''Dataframes of `read_pandas(..., lazy=True)`, each record type is read on first access
+    (running atop with just its label) and kept.
+
+    Keys are all the record types that can be read, a type without any records in the logs
+    raises KeyError once read.
+
+    :param types: record types
+    :param read: function of `record_types` returning a dict of dataframes
+    :param workers: number of worker processes `load` reads pending record types with
+    '''
+
+    def __init__(self, types, read, workers=None):
+        self.types = list(types)
+        self.workers = workers
+        self._read = read
+        self._frames = {}
+        self._loaded = set()
+
+    def __getitem__(self, type_):
+        if type_ not in self.types:
+            raise KeyError(type_)
+        if type_ not in self._loaded:
+            self.load([type_])
+        if type_ not in self._frames:
+            raise KeyError(f'no {type_} records in the logs')
+        return self._frames[type_]
+
+    def __contains__(self, type_):
+        # without reading it, see `Mapping.__contains__`
+        return type_ in self.types
+
+    def __iter__(self):
+        return iter(self.types)
+
+    def __len__(self):
+        return len(self.types)
+
+    @property
+    def pending(self):
+        'Record types not read yet.'
+        return [t for t in self.types if t not in self._loaded]
+
+    def load(self, types=None):
+        '''Read given (or all pending) record types, several at a time with `workers`.
+
+        :returns: self
+        '''
+
+        types = [t for t in (types or self.types) if t not in self._loaded]
+        # one atop run per label, e.g. NET gives both NET and NET_IF
+        labels = list(dict.fromkeys(_record_label(t) for t in types))
+
+        if self.workers is not None and self.workers > 1 and len(labels) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(min(self.workers, len(labels))) as executor:
+                results = list(executor.map(self._read, [[label] for label in labels]))
+        else:
+            results = [self._read([label]) for label in labels]
+
+        for frames in results:
+            self._frames.update(frames)
+        self._loaded.update(t for t in self.types if _record_label(t) in labels)
+        return self
+
+
+def _record_label(type_):
+    'Atop label (as given to `-P`) of record type.'
+    return {'CPU_N': 'cpu', 'NET_IF': 'NET'}.get(type_, type_)
+
+
+def _cached_log(cache_dir, path, record_types, binary, backend, schema, schema_hash):
+    '''Make sure given record types of a log file are cached.
+
+    The entry is locked while it is checked and filled, other processes (e.g. workers of
+    `LazyFrames.load`) adding record types to the same entry wait and see them in meta.json.
+
+    :returns: tuple of (cache entry directory, entry metadata)
+    '''
+
+    import fcntl
+    import hashlib
+
+    path = os.path.abspath(path)
+    key = hashlib.sha1(path.encode()).hexdigest()[:12]
+    entry_dir = os.path.join(cache_dir, f'{os.path.basename(path)}-{key}')
+
+    # next to the entry so it survives the entry being removed
+    with open(entry_dir + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return _fill_cache_entry(entry_dir, path, record_types, binary, backend, schema, schema_hash)
+
+
+def _fill_cache_entry(entry_dir, path, record_types, binary, backend, schema, schema_hash):
+    'Body of `_cached_log`, the entry must be locked.'
+
+    import json
+    import shutil
+
+    meta_path = os.path.join(entry_dir, 'meta.json')
+    stat = os.stat(path)
+
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if (meta['size'], meta['mtime'], meta['schema']) != (stat.st_size, stat.st_mtime, schema_hash):
+            meta = None
+
+    if meta is None:
+        # stale entry or left over by an interrupted fill (no meta.json yet)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.makedirs(entry_dir)
+        meta = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'schema': schema_hash,
+                'labels': [], 'types': []}
+
+    if 'ALL' in meta['labels']:
+        missing = []
+    elif 'ALL' in record_types:
+        missing = ['ALL']
+    else:
+        missing = [t for t in record_types if t not in meta['labels']]
+
+    if missing:
+        counters = []
+        records = _iterate_file_records(path, -1, 0, {}, missing, binary, backend=backend, schema=schema)
+        frames = to_pandas(_keep_return_value(records, counters), schema=schema)
+        meta['sample_n'], meta['boot_n'] = counters
+
+        # files only appear complete, meta.json is written last
+        for type_, df in frames.items():
+            parquet_path = os.path.join(entry_dir, f'{type_}.parquet')
+            df.to_parquet(parquet_path + '.tmp', index=False)
+            os.replace(parquet_path + '.tmp', parquet_path)
+
+        meta['labels'] = sorted(set(meta['labels'] + missing))
+        meta['types'] = sorted(set(meta['types'] + list(frames)))
+
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    else:
+        # mark as recently used
+        os.utime(meta_path)
+
+    return entry_dir, meta
+
+
+def _evict_cache(cache_dir, cache_size, keep=()):
+    'Remove least recently used entries from the cache until it fits into `cache_size` bytes.'
+
+    import fcntl
+    import shutil
+
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        if not os.path.isdir(entry_dir):
+            continue
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        # entries of interrupted fills have no meta.json, they are evicted by age of the directory
+        used_path = meta_path if os.path.exists(meta_path) else entry_dir
+        size = sum(e.stat().st_size for e in os.scandir(entry_dir))
+        entries.append((os.stat(used_path).st_mtime, size, entry_dir))
+        total += size
+
+    for _, size, entry_dir in sorted(entries):
+        if total <= cache_size:
+            break
+        if entry_dir in keep:
+            continue
+        with open(entry_dir + '.lock', 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # being filled by another process
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+
+
+def to_sqlite(filename, iterator, progress=None, schema='default', use_types=True,
+              batch_size=10000, journal_mode=None, synchronous=None, cache_size=None, indexes=True,
+              rollups=None, stats=None, split_processes=False):
+    '''Create sqlite database from given iterator returned by `iterate_atop_records`.
+    One table per record type.
+
+    Records are buffered per type and inserted with `executemany` in batches of `batch_size`,
+    everything is written in a single transaction.
+
+    :param journal_mode: value for `PRAGMA journal_mode` (e.g. 'WAL'), `None` keeps sqlite default
+    :param synchronous: value for `PRAGMA synchronous` (e.g. 'OFF', 'NORMAL'), `None` keeps sqlite default
+    :param cache_size: value for `PRAGMA cache_size` (pages, or KiB if negative), `None` keeps sqlite default
+    :param indexes: create indexes on epoch, sample_n and (for process tables) TID, TGID, name, process_id
+                    once all records are inserted
+    :param rollups: optional resolutions (e.g. ('1m', '10m', '1h')) of rollup tables to create
+                    once all records are inserted, see `update_sqlite_rollups`
+    :param stats: optional `AtopStats` to add time spent in sqlite to (the sqlite timer)
+    :param split_processes: split PRG into a PROCESS dimension table and a slim per sample PRG table,
+                            see `split_process_records`
+    :returns: open sqlite connection
+    '''
+
+    if stats is not None:
+        from time import perf_counter
+
+        start = perf_counter()
+        source = _TimedIterator(iterator)
+        conn = to_sqlite(filename, source, progress, schema, use_types, batch_size, journal_mode,
+                         synchronous, cache_size, indexes, rollups, split_processes=split_processes)
+        stats.timers['sqlite'] += perf_counter() - start - source.seconds
+        stats.counters['rows.sqlite'] += source.n
+        return conn
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    conn = _connect_sqlite(filename, journal_mode, synchronous, cache_size)
+    tables = {}
+
+    if split_processes:
+        _insert_sqlite(conn, split_process_records(iterator, schema), split_process_schema(schema),
+                       batch_size, tables, progress)
+    else:
+        _insert_sqlite(conn, iterator, schema, batch_size, tables, progress)
+
+    if indexes:
+        for type_ in tables:
+            _create_sqlite_indexes(conn, type_)
+
+    conn.commit()
+
+    if rollups:
+        update_sqlite_rollups(conn, rollups, schema)
+
+    return conn
+
+
+def append_sqlite(filename, samples, schema='default', commit_every=1,
+                  journal_mode='WAL', synchronous=None, cache_size=None, indexes=True, rollups=None):
+    '''Continuously append per sample batches of records into sqlite database (created if missing).
+
+    Meant to consume `iterate_live_records(..., by_sample=True)` or `follow_atop_records(..., by_sample=True)`,
+    a transaction is committed after every `commit_every` samples so readers only ever see whole samples.
+    Rollup tables (see `update_sqlite_rollups`) are updated with every commit.
+    Returns once `samples` is exhausted. See `to_sqlite` for the rest of parameters.
+
+    :param samples: iterator of lists of records
+    :returns: open sqlite connection
+    '''
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    conn = _connect_sqlite(filename, journal_mode, synchronous, cache_size)
+    tables = {}
+
+    for i, sample in enumerate(samples, 1):
+        created = len(tables)
+        _insert_sqlite(conn, sample, schema, len(sample), tables, exist_ok=True)
+        if indexes and len(tables) != created:
+            for type_ in list(tables)[created:]:
+                _create_sqlite_indexes(conn, type_)
+        if i % commit_every == 0:
+            conn.commit()
+            if rollups:
+                update_sqlite_rollups(conn, rollups, schema)
+
+    conn.commit()
+    if rollups:
+        update_sqlite_rollups(conn, rollups, schema)
+    return conn
+
+
+def _connect_sqlite(filename, journal_mode, synchronous, cache_size, check_same_thread=True):
+    import sqlite3
+
+    conn = sqlite3.connect(filename, check_same_thread=check_same_thread)
+    for pragma, value in (('journal_mode', journal_mode), ('synchronous', synchronous),
+                          ('cache_size', cache_size)):
+        if value is not None:
+            conn.execute(f'PRAGMA {pragma}={value}')
+    return conn
+
+
+def _insert_sqlite(conn, iterator, schema, batch_size, tables, progress=None, exist_ok=False):
+    '''Insert records into sqlite creating missing tables.
+
+    :param tables: cache of type -> INSERT expression, updated with created tables
+    '''
+
+    buffers = defaultdict(list)
+    current_file = None
+    current_file_i = -1
+
+    for record in iterator:
+        if progress:
+            file = record[5]
+            if current_file != file:
+                current_file = file
+                current_file_i += 1
+                progress(current_file_i)
+
+        type_ = record[0]
+        if type_ not in tables:
+            tables[type_] = _create_sqlite_table(conn, record, schema, exist_ok)
+
+        # insert
+        buffer = buffers[type_]
+        buffer.append(record)
+        if len(buffer) >= batch_size:
+            conn.executemany(tables[type_], buffer)
+            buffer.clear()
+
+    for type_, buffer in buffers.items():
+        if buffer:
+            conn.executemany(tables[type_], buffer)
+
+
+def _create_sqlite_table(conn, record, schema, exist_ok=False):
+    '''Create table for the type of given record.
+
+    :returns: INSERT expression for the table
+    '''
+
+    type_ = record[0]
+
+    if not schema:
+        extra_vals_len = len(record) - len(GENERIC_FIELDS)
+        extra_fields = [f'val{n}' for n in range(1, extra_vals_len+1)]
+    else:
+        extra_fields = [field[0] for field in schema[type_]['fields']]
+        _ensure_schema(record, schema)
+
+    sql_types = [_SQL_TYPES[type(v)] for v in record]
+    sql_defs = [f'{a} {b}' for a, b in zip((*GENERIC_FIELDS, *extra_fields), sql_types)]
+    sql_defs = ', '.join(sql_defs)
+    if_not_exists = 'IF NOT EXISTS ' if exist_ok else ''
+    conn.execute(f'CREATE TABLE {if_not_exists}{type_} ({sql_defs})')
+
+    placeholder = ','.join('?' for _ in range(len(record)))
+    return f'INSERT INTO {type_} VALUES ({placeholder})'
+
+
+def _create_sqlite_indexes(conn, table):
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    indexed = ['epoch', 'sample_n', 'host']
+    if table.startswith('PR') or table == 'PS':
+        indexed += ['TID', 'TGID', 'name', 'process_id']
+
+    for column in indexed:
+        if column in columns:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})')
+
+
+def ingest_sqlite(filename, files, record_types=('ALL',), binary='atop', backend='atop',
+                  progress=None, schema='default', batch_size=10000,
+                  journal_mode=None, synchronous=None, cache_size=None, indexes=True, rollups=None,
+                  workers=None, stats=None):
+    '''Incrementally add atop records into sqlite database (created if missing).
+
+    A watermark is stored per log file in the `atop_ingest` table (size, mtime, last ingested epoch
+    and sample numbering) so consecutive runs only process new files and the new tail of a growing one,
+    `sample_n` and `boot_n` continue the numbering of previously ingested files.
+    Each file is committed together with its watermark so an interrupted run can be resumed,
+    rollup tables (see `update_sqlite_rollups`) only recompute buckets touched by the new records.
+    See `to_sqlite` for the rest of parameters.
+
+    :param files: atop logs as returned by `list_atop_logs`
+    :param progress: called with the index of each file that needs processing
+    :param workers: number of worker processes decoding files ahead, files are still inserted in order
+    :param stats: optional `AtopStats` to collect counters and timers into
+    :returns: open sqlite connection
+    '''
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    conn = _connect_sqlite(filename, journal_mode, synchronous, cache_size)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS atop_ingest ({", ".join(_INGEST_STATE_FIELDS)}, '
+                 'PRIMARY KEY (path))')
+    conn.commit()
+
+    cursor = conn.execute(f'SELECT {", ".join(_INGEST_STATE_FIELDS)} FROM atop_ingest')
+    state = {row[0]: dict(zip(_INGEST_STATE_FIELDS, row)) for row in cursor}
+    tables = {}
+
+    def insert(records):
+        _insert_sqlite(conn, records, schema, batch_size, tables, exist_ok=True)
+
+    for i, records, entry in _iterate_ingest(files, state, record_types, binary, backend, schema, workers, stats):
+        if progress:
+            progress(i)
+
+        _timed_write(stats, 'sqlite', records, insert)
+
+        placeholder = ','.join('?' for _ in _INGEST_STATE_FIELDS)
+        conn.execute(f'INSERT OR REPLACE INTO atop_ingest VALUES ({placeholder})',
+                     [entry[f] for f in _INGEST_STATE_FIELDS])
+        conn.commit()
+
+    if indexes:
+        for type_ in tables:
+            _create_sqlite_indexes(conn, type_)
+        conn.commit()
+
+    if rollups:
+        update_sqlite_rollups(conn, rollups, schema)
+
+    return conn
+
+
+def ingest_parquet(root, files, record_types=('ALL',), binary='atop', backend='atop',
+                   progress=None, schema='default', workers=None, stats=None):
+    '''Incrementally add atop records into a directory of parquet files (created if missing).
+    Requires pandas and pyarrow (or fastparquet).
+
+    Same as `ingest_sqlite` but each run writes one part per record type and processed file
+    as `<root>/<type>/<log file name>.<first epoch>.parquet`, watermarks are kept in `<root>/ingest.json`.
+    Read a type back with `pandas.read_parquet(os.path.join(root, type))`.
+    '''
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    def write(records, entry):
+        for type_, df in to_pandas(records, schema=schema).items():
+            os.makedirs(os.path.join(root, type_), exist_ok=True)
+            name = f'{os.path.basename(entry["path"])}.{df.epoch.iloc[0]}.parquet'
+            df.to_parquet(os.path.join(root, type_, name), index=False)
+
+    _ingest_directory(root, files, record_types, binary, backend, progress, schema, workers, stats,
+                      'parquet', write)
+
+
+def ingest_csv(root, files, record_types=('ALL',), binary='atop', backend='atop',
+               progress=None, schema='default', workers=None, stats=None):
+    '''Incrementally add atop records into a directory of csv files (created if missing).
+
+    Same as `ingest_parquet` but parts are csv files with a header line
+    (`<root>/<type>/<log file name>.<first epoch>.csv`) written as records arrive.
+    '''
+
+    import csv
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    def write(records, entry):
+        # record type -> (file, csv writer)
+        outputs = {}
+        try:
+            for record in records:
+                output = outputs.get(record[0])
+                if output is None:
+                    type_ = record[0]
+                    os.makedirs(os.path.join(root, type_), exist_ok=True)
+                    name = f'{os.path.basename(entry["path"])}.{record[1]}.csv'
+                    file = open(os.path.join(root, type_, name), 'w', newline='')
+                    output = outputs[type_] = file, csv.writer(file)
+                    if schema:
+                        _ensure_schema(record, schema)
+                        header = (*GENERIC_FIELDS, *[field[0] for field in schema[type_]['fields']])
+                    else:
+                        extra_vals_len = len(record) - len(GENERIC_FIELDS)
+                        header = (*GENERIC_FIELDS, *[f'val{n}' for n in range(1, extra_vals_len+1)])
+                    output[1].writerow(header)
+                output[1].writerow(record)
+        finally:
+            for file, _ in outputs.values():
+                file.close()
+
+    _ingest_directory(root, files, record_types, binary, backend, progress, schema, workers, stats, 'csv', write)
+
+
+def _ingest_directory(root, files, record_types, binary, backend, progress, schema, workers, stats,
+                      timer, write):
+    '''Common part of `ingest_parquet` and `ingest_csv`.
+
+    :param write: function of (records, state entry) writing records of a file into `root`
+    '''
+
+    import json
+
+    state_path = os.path.join(root, 'ingest.json')
+    os.makedirs(root, exist_ok=True)
+
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = {entry['path']: entry for entry in json.load(f)}
+
+    for i, records, entry in _iterate_ingest(files, state, record_types, binary, backend, schema, workers, stats):
+        if progress:
+            progress(i)
+
+        _timed_write(stats, timer, records, lambda records: write(records, entry))
+
+        # replace atomically so an interrupted run never leaves a broken state file
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump(list(state.values()), f, indent=1)
+        os.replace(state_path + '.tmp', state_path)
+
+
+def _timed_write(stats, timer, records, write):
+    '''Call `write(records)` adding the time it took (without producing the records)
+    and the number of records to `stats`.'''
+
+    if stats is None:
+        return write(records)
+
+    from time import perf_counter
+
+    start = perf_counter()
+    source = _TimedIterator(records)
+    result = write(source)
+    stats.timers[timer] += perf_counter() - start - source.seconds
+    stats.counters[f'rows.{timer}'] += source.n
+    return result
+
+
+_INGEST_STATE_FIELDS = ('path', 'size', 'mtime', 'last_epoch', 'last_sample_n', 'last_boot_n',
+                        'first_sample_n', 'first_boot_n', 'sample_n', 'boot_n')
+
+
+def _iterate_ingest(files, state, record_types, binary, backend, schema, workers=None, stats=None):
+    '''Iterate through files that are new or have grown since the watermarks in `state`.
+
+    Numbering of a new file continues from the closest previously ingested file before it,
+    a grown file is read from its last ingested sample on and continues its numbering
+    (see `_iterate_new_records`). `state` is updated in place once records of a file are exhausted.
+
+    :param workers: number of worker processes decoding files ahead (numbered from zero and shifted
+                    once the numbering of the previous file is known, same as `iterate_atop_records`)
+    :returns: an iterator that yields tuples of (index in `files`, records iterator, state entry)
+    '''
+
+    # stat before reading so anything appended meanwhile is picked up on the next run
+    stats_by_path = {path: os.stat(path) for path in files}
+    changed = [path for path in files if _ingest_changed(stats_by_path[path], state.get(path))]
+
+    streams = None
+    if workers is not None and workers > 1:
+        reader_kw = dict(record_types=record_types, binary=binary, backend=backend, schema=schema,
+                         stats=None if stats is None else AtopStats())
+
+        def job(path):
+            entry = state.get(path)
+            if entry is None or entry['last_epoch'] is None:
+                return path, reader_kw
+            return path, dict(reader_kw, time_range=(entry['last_epoch'], None), begin=entry['last_epoch'])
+
+        streams = _iterate_parallel_runs((job(path) for path in changed), workers, stats)
+
+    try:
+        for i, path in enumerate(files):
+            stat = stats_by_path[path]
+            entry = state.get(path)
+            later = [p for p in state if p > path]
+
+            if entry is not None:
+                if not _ingest_changed(stat, entry):
+                    continue
+                if later:
+                    raise ValueError(f'{path} changed after later logs were ingested, '
+                                     'numbering of samples would be inconsistent, rebuild the store')
+                sample_n, boot_n = entry['first_sample_n'], entry['first_boot_n']
+                last = entry['last_epoch'], entry['last_sample_n'], entry['last_boot_n']
+            else:
+                if later:
+                    raise ValueError(f'{path} is older than already ingested logs, '
+                                     'numbering of samples would be inconsistent, rebuild the store')
+                earlier = [p for p in state if p < path]
+                sample_n, boot_n = -1, 0
+                if earlier:
+                    previous = state[max(earlier)]
+                    sample_n, boot_n = previous['sample_n'], previous['boot_n']
+                last = None, None, None
+
+            # changed files are streamed by the workers in order
+            runs = None if streams is None else next(streams)
+
+            entry = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                     **dict(zip(('last_epoch', 'last_sample_n', 'last_boot_n'), last)),
+                     'first_sample_n': sample_n, 'first_boot_n': boot_n}
+            records = _iterate_new_records(path, record_types, binary, backend, schema, entry, state,
+                                           runs, stats)
+            yield i, records, entry
+    finally:
+        if streams is not None:
+            streams.close()
+
+
+def _ingest_changed(stat, entry):
+    return entry is None or (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime)
+
+
+def _iterate_new_records(path, record_types, binary, backend, schema, entry, state, runs=None, stats=None):
+    '''Records of `path` past the watermark of `entry`.
+
+    A new file is numbered from its first sample on. A grown file is only read from the minute
+    of its last ingested sample on (`atop -b`, the raw backend skips older samples without
+    decompressing them), that sample keeps its numbering (see `_continue_numbering`).
+
+    :param runs: runs of the file read by a worker (see `_iterate_parallel_runs`) with
+                 the same `time_range` and `begin`, numbered from zero; the file is read here if `None`
+    '''
+
+    last_epoch = entry['last_epoch']
+    if last_epoch is None:
+        if runs is None:
+            records = _iterate_file_records(path, entry['first_sample_n'], entry['first_boot_n'], {},
+                                            record_types, binary, backend=backend, schema=schema, stats=stats)
+        else:
+            records = _runs_to_records(_shift_runs(runs, entry['first_sample_n'] + 1, entry['first_boot_n']))
+    else:
+        if runs is None:
+            records = _iterate_file_records(path, -1, 0, {}, record_types, binary, backend=backend, schema=schema,
+                                            stats=stats, time_range=(last_epoch, None), begin=last_epoch)
+        else:
+            records = _runs_to_records(runs)
+        records = _continue_numbering(records, last_epoch, entry['last_sample_n'], entry['last_boot_n'])
+
+    counters = []
+    for record in _keep_return_value(records, counters):
+        entry['last_epoch'], entry['last_sample_n'], entry['last_boot_n'] = record[1], record[3], record[4]
+        yield record
+
+    entry['sample_n'], entry['boot_n'] = counters
+    state[path] = entry
+
+
+def hosts_to_sqlite(filename, hosts, record_types=('ALL',), binary='atop', concurrency=None, progress=None,
+                    schema='default', batch_size=10000, journal_mode=None, synchronous=None, cache_size=None,
+                    indexes=True, pids=None, names=None, processes_only=False):
+    '''Read atop logs of many hosts concurrently into one sqlite database.
+
+    atop processes are started with asyncio and read as their output arrives, logs of different
+    hosts are read concurrently while logs of a single host are read in order to number its
+    samples (`sample_n` and `boot_n` are per host). Output is decoded in a pool of worker processes
+    and inserted in a single writer thread, so the event loop keeps reading the other atop processes
+    meanwhile and only the inserts are serialized.
+    Every table gets a `host` column right after the generic fields (see `GENERIC_FIELDS`).
+
+    All hosts share one connection and so one transaction: it is committed whenever a file
+    is fully inserted, which also commits what other hosts have inserted of their current files.
+    An interrupted run can leave partially inserted files behind, start over into a new database.
+
+    :param hosts: dict of host name -> atop logs of the host (e.g. `list_atop_logs(root=...)`)
+    :param concurrency: maximum number of atop processes running at once (and of decoding processes),
+                        number of CPUs by default
+    :param progress: called with host name and index of the file in its list when a file is started
+    :returns: open sqlite connection
+
+    See `to_sqlite` and `iterate_atop_records` for the rest of parameters.
+    '''
+
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+    if schema == 'default':
+        schema = parse_atop_schema(ATOP_SCHEMA)
+
+    # the schema gets the host field, decoders only produce the ones after it
+    decoder_schema = schema
+    schema = _add_host_field(schema)
+    concurrency = concurrency or os.cpu_count() or 1
+
+    # the connection is only used by the writer thread until it is returned
+    conn = _connect_sqlite(filename, journal_mode, synchronous, cache_size, check_same_thread=False)
+    tables = {}
+
+    async def ingest(decoders, writer):
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*[
+            _ingest_host_sqlite(conn, tables, decoders, writer, host, files, semaphore, schema, batch_size,
+                                progress, record_types, binary)
+            for host, files in hosts.items()])
+
+    with ProcessPoolExecutor(concurrency, initializer=_init_output_decoder,
+                             initargs=(decoder_schema, pids, names, processes_only)) as decoders, \
+            ThreadPoolExecutor(1) as writer:
+        asyncio.run(ingest(decoders, writer))
+
+    if indexes:
+        for type_ in tables:
+            _create_sqlite_indexes(conn, type_)
+
+    conn.commit()
+    return conn
+
+
+def _add_host_field(schema):
+    'Copy of `schema` with `host` as the first type specific field of every type.'
+
+    return {type_: {'desc': entry['desc'],
+                    'fields': [['host', 'host the log was collected from'], *entry['fields']],
+                    'types': [str, *entry['types']],
+                    'units': [None, *entry['units']]}
+            for type_, entry in schema.items()}
+
+
+async def _ingest_host_sqlite(conn, tables, decoders, writer, host, files, semaphore, schema, batch_size,
+                              progress, record_types, binary):
+    '''Read logs of one host into `conn`, decoding output in the `decoders` process pool
+    (see `_decode_output`) and inserting in the `writer` executor.'''
+
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+
+    sample_n = -1
+    boot_n = 0
+
+    def insert(runs):
+        records = _runs_to_records(iter(runs))
+        _insert_sqlite(conn, (r[:6] + (host,) + r[6:] for r in records), schema, batch_size,
+                       tables, exist_ok=True)
+
+    for i, path in enumerate(files):
+        async with semaphore:
+            if progress:
+                progress(host, i)
+
+            p = await asyncio.create_subprocess_exec(binary, '-r', path, '-P', ','.join(record_types),
+                                                     stdout=asyncio.subprocess.PIPE)
+            # the previous chunk is inserted while the next one is read and decoded
+            inserting = None
+            try:
+                sample_n += 1
+
+                # first 'RESET' line usually log reset not machine reboot so we skip it
+                await p.stdout.readline()
+
+                rest = b''
+                while True:
+                    chunk = await p.stdout.read(1 << 20)
+                    if chunk:
+                        chunk = rest + chunk
+                    elif rest:
+                        # the last line may not end with a line end
+                        chunk = rest + b'\n'
+                    else:
+                        break
+
+                    # decode whole lines only, the last one may continue in the next chunk
+                    end = chunk.rfind(b'\n') + 1
+                    rest = chunk[end:]
+
+                    runs, (sample_n, boot_n) = await loop.run_in_executor(
+                        decoders, _decode_output, chunk[:end], path, sample_n, boot_n)
+                    if inserting is not None:
+                        await inserting
+                    inserting = loop.run_in_executor(writer, insert, runs)
+
+                await p.wait()
+            finally:
+                if inserting is not None:
+                    await inserting
+                if p.returncode is None:
+                    p.kill()
+                    await p.wait()
+
+        await loop.run_in_executor(writer, conn.commit)
+
+
+# schema, line filter and decoders cache of a worker process of `hosts_to_sqlite`
+_output_decoder = None
+
+
+def _init_output_decoder(schema, pids, names, processes_only):
+    global _output_decoder
+    _output_decoder = schema, _make_line_filter(None, pids, names, processes_only), {}
+
+
+def _decode_output(data, log_file, sample_n, boot_n):
+    '''Decode whole lines of `atop -P` output into runs of records (see `_iterate_output_runs`)
+    in a worker process set up by `_init_output_decoder`.
+
+    :returns: list of runs and (`sample_n`, `boot_n`) after the last line
+    '''
+
+    schema, keep, decoders = _output_decoder
+    counters = []
+    runs = _iterate_output_runs(data.decode('utf8').splitlines(keepends=True), log_file, sample_n, boot_n,
+                                decoders, keep, schema, True, {})
+    return list(_keep_return_value(runs, counters)), tuple(counters)
+
+
+def main(argv=None):
+    '''Command line interface, see `python -m atop_reader convert --help`.'''
+
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m atop_reader', description='Atop logs reader.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help='convert atop logs to sqlite, parquet or csv')
+    convert.add_argument('output', help='sqlite database, or directory of parquet or csv files')
+    convert.add_argument('--root', default='/var/log/atop', help='atop log directory')
+    convert.add_argument('--start', help='first day to convert (YYYY-MM-DD), by log file name')
+    convert.add_argument('--end', help='last day to convert (YYYY-MM-DD), inclusive')
+    convert.add_argument('--types', nargs='+', default=['ALL'], help='record types to read (atop -P labels)')
+    convert.add_argument('--format', choices=('sqlite', 'parquet', 'csv'), default='sqlite')
+    convert.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes decoding logs')
+    convert.add_argument('--batch-size', type=int, default=10000, help='records per sqlite insert')
+    convert.add_argument('--binary', default='atop')
+    convert.add_argument('--backend', choices=('atop', 'raw'), default='atop')
+    convert.add_argument('--resume', action='store_true',
+                         help='continue an interrupted conversion (or add new logs to a previous one)')
+    convert.add_argument('--quiet', action='store_true', help='do not print files as they are converted')
+
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.output) and not args.resume:
+        parser.error(f'{args.output} already exists, use --resume to continue converting into it')
+
+    files = list_atop_logs(args.root)
+    if args.start or args.end:
+        start = (args.start or '').replace('-', '')
+        end = (args.end or '').replace('-', '') or '99999999'
+        files = [f for f in files if start <= os.path.basename(f)[len('atop_'):][:8] <= end]
+
+    def progress(i):
+        if not args.quiet:
+            print(files[i], file=sys.stderr)
+
+    stats = AtopStats()
+    reader_kw = dict(record_types=args.types, binary=args.binary, backend=args.backend, progress=progress,
+                     workers=args.workers, stats=stats)
+
+    if args.format == 'sqlite':
+        ingest_sqlite(args.output, files, batch_size=args.batch_size, journal_mode='WAL', synchronous='NORMAL',
+                      **reader_kw).close()
+    elif args.format == 'parquet':
+        ingest_parquet(args.output, files, **reader_kw)
+    else:
+        ingest_csv(args.output, files, **reader_kw)
+
+    print(stats.report())
 
 
 if __name__ == '__main__':
-    from itertools import islice
-    from pprint import pprint
-
-    print('sample records:')
-    for record in islice(iterate_atop_records(list_atop_logs()[-1:]), 20):
-        print(record)
-
-    schema = parse_atop_schema(ATOP_SCHEMA)
-    type_ = 'MEM'
-    print(f'\nsample type schema ({type_} - {schema[type_]["desc"]}):')
-    pprint(schema[type_]['fields'])
-
-    # import sys
-    # files = list_atop_logs()[-1:]
-    # iterator = islice(iterate_atop_records(files), 20000)
-    # iterator = iterate_atop_records(files)
-    # to_sqlite(sys.argv[1], iterator, progress=lambda i: print(files[i]))
-
-    # import sys
-    # files = list_atop_logs()[-3:]
-    # iterator = islice(iterate_atop_records(files), 50000)
-    # iterator = iterate_atop_records(files)
-    # frames = to_pandas(iterator, progress=lambda i: print(files[i]))
-    # from IPython.terminal import debugger; debugger.set_trace()
+    main()
@@ -1,3 +1,5 @@
+import warnings
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -20,45 +22,91 @@ def humansize(num, suffix='B'):
 
 
 def generate_paths(df_ps):
-    grouper = df_ps.groupby('Sample_n')
-    groups = grouper.groups
-
-    def fill_tables(p):
-        tid2ppid[p.PRG_TID] = p.PRG_PPID
-        tid2name[p.PRG_TID] = p.PRG_name
-
-    def get_path(p):
-        parent = p.PRG_PPID
-        name = p.PRG_name
-        while parent:
-            name = name + '—' + tid2name.get(parent, '???')
-            parent = tid2ppid.get(parent)
-        return name
+    '''Build process tree paths like "name—parent name—grandparent name" for every row of `df_ps`.
+    Ancestors are looked up within the same sample, unknown parents are shown as "???".
 
-    result = pd.Series()
+    Works on all samples at once: each step moves every row one level up the tree over TID -> PPID
+    arrays and identical chains are given the same id, strings are only built once per distinct chain.
 
-    for i, k in enumerate(groups):
-        if i % 10 == 0:
-            print(f'\r{i/len(groups):.2f} done', end='')
-
-        tid2ppid = {}
-        tid2name = {}
+    :param df_ps: dataframe with Sample_n, PRG_TID, PRG_PPID and PRG_name columns
+    :returns: series of paths indexed as `df_ps`
+    '''
 
-        g = grouper.get_group(k)
+    n = len(df_ps)
+    sample = df_ps['Sample_n'].to_numpy()
+    ppid = df_ps['PRG_PPID'].to_numpy()
+    name_codes, names = pd.factorize(df_ps['PRG_name'].to_numpy())
+    names = list(names) + ['???']
+    unknown = len(names) - 1
+
+    # row of the parent within the same sample, for duplicated TIDs the last row wins
+    keys = pd.MultiIndex.from_arrays([sample, df_ps['PRG_TID'].to_numpy()])
+    last = ~keys.duplicated(keep='last')
+    positions = keys[last].get_indexer(pd.MultiIndex.from_arrays([sample, ppid]))
+    parent_row = np.where(positions >= 0, np.flatnonzero(last)[np.maximum(positions, 0)], -1)
+
+    # chain ids: rows get the same id when their paths up to the current level are the same
+    chain = name_codes.astype(np.int64)
+    next_id = len(names)
+
+    rows = np.flatnonzero(ppid != 0)
+    current = parent_row[rows]
+
+    # a cycle in the tree would never end, no path can be longer than the number of rows
+    for _ in range(n):
+        if not len(rows):
+            break
+
+        codes = np.where(current >= 0, name_codes[np.maximum(current, 0)], unknown)
+        new_ids, uniques = pd.factorize(chain[rows] * len(names) + codes)
+        chain[rows] = new_ids + next_id
+        next_id += len(uniques)
+
+        # continue only with rows whose ancestor is known and has a parent itself
+        known = current >= 0
+        rows, current = rows[known], current[known]
+        more = ppid[current] != 0
+        rows, current = rows[more], parent_row[current[more]]
+
+    # build strings once per distinct chain
+    chain_ids, first_rows = np.unique(chain, return_index=True)
+    paths = [_build_path(row, name_codes, names, ppid, parent_row, n) for row in first_rows]
+    paths = np.array(paths, dtype=object)[np.searchsorted(chain_ids, chain)]
+
+    return pd.Series(paths, index=df_ps.index)
+
+
+def _build_path(row, name_codes, names, ppid, parent_row, max_depth):
+    path = [names[name_codes[row]]]
+    parent = ppid[row]
+    for _ in range(max_depth):
+        if not parent:
+            break
+        up = parent_row[row]
+        if up < 0:
+            path.append('???')
+            break
+        path.append(names[name_codes[up]])
+        row, parent = up, ppid[up]
+    return '—'.join(path)
 
-        g.apply(fill_tables, axis=1)
-        strings = g.apply(get_path, axis=1)
-        result = result.append(strings)
 
-    print()
-    return result
+def stripes(values, xlim=None, labels=None, vmin=0, vmax=None,
+            ax=None, cax=None, title=None, cmap=None, cbar_kw=None, pooling='max'):
+    '''Plot each row of `values` as a horizontal stripe of colors, the first row at the top.
 
+    All stripes are drawn as a single image. When there are more columns than pixels
+    across the axes, neighbouring columns are pooled together first.
 
-def stripes(values, xlim=None, labels=None, vmin=0, vmax=None,
-            ax=None, cax=None, title=None, cmap=None, cbar_kw=None):
+    :param values: 2-D array or a list of equally long sequences
+    :param pooling: 'max', 'mean' or None to draw every column
+    '''
     ax = ax or plt.gca()
 
-    x1, x2 = xlim = (xlim or (0, len(values[0])-1))
+    values = np.asarray([np.asarray(v, dtype=float) for v in values])
+    n_rows, n_cols = values.shape
+
+    x1, x2 = xlim = (xlim or (0, n_cols-1))
     ax.set_xlim(xlim)
     if hasattr(x1, 'date'):
         x1, x2 = date2num(x1), date2num(x2)
@@ -66,28 +114,37 @@ def stripes(values, xlim=None, labels=None, vmin=0, vmax=None,
     bar_size = .5
     hals_size = bar_size/2
 
-    ax.set_ylim((hals_size-1, len(values)-hals_size))
+    ax.set_ylim((hals_size-1, n_rows-hals_size))
 
     if vmax is None:
-        vmax = np.max([np.max(v) for v in values])
+        vmax = np.nanmax(values)
 
     norm = Normalize(vmin, vmax, clip=True)
-    cmap = plt.get_cmap(cmap or 'gist_heat_r')
-
-    for i, vals in enumerate(reversed(values)):
-        ax.imshow(vals[np.newaxis, :],
-                  extent=(x1, x2, i-hals_size, i+hals_size),
-                  cmap=cmap, norm=norm)
-
-    ax.yaxis.set_ticks(range(0, len(values)))
-    labels = reversed(labels) if labels else range(len(values), 0, -1)
+    cmap = plt.get_cmap(cmap or 'gist_heat_r').with_extremes(bad=(0, 0, 0, 0))
+
+    # more columns than pixels, pool them so the image is not resampled by matplotlib
+    width = int(ax.get_window_extent().width)
+    if pooling and width and n_cols > width:
+        size = -(-n_cols // width)
+        values = _pool_columns(values, size, pooling)
+        # the last pool is padded, stretch the extent so columns keep their width
+        x2 = x1 + (x2 - x1) * values.shape[1] * size / n_cols
+
+    # bars are separated by transparent gaps of the same height, stripes go from the bottom up
+    image = np.full((n_rows * 2, values.shape[1]), np.nan)
+    image[::2] = values[::-1]
+    ax.imshow(image, extent=(x1, x2, -hals_size, n_rows-hals_size), origin='lower',
+              cmap=cmap, norm=norm, interpolation='nearest')
+
+    ax.yaxis.set_ticks(range(0, n_rows))
+    labels = reversed(labels) if labels else range(n_rows, 0, -1)
     ax.set_yticklabels(labels)
 
     ax.set_aspect('auto')
 
     if not cax:
         # should've used a AxesGrid/cbar.make_axes_gridspec instead of this trickery
-        cax, kw = cbar.make_axes(ax, location='top', shrink=.7, pad=.5/len(values), aspect=40)
+        cax, kw = cbar.make_axes(ax, location='top', shrink=.7, pad=.5/n_rows, aspect=40)
     if title is not None:
         cax.set_title(title)
 
@@ -101,6 +158,66 @@ def stripes(values, xlim=None, labels=None, vmin=0, vmax=None,
     return ax, cax
 
 
+def _pool_columns(values, size, how):
+    n_rows, n_cols = values.shape
+    padded = np.full((n_rows, -(-n_cols // size) * size), np.nan)
+    padded[:, :n_cols] = values
+    pools = padded.reshape(n_rows, -1, size)
+    with warnings.catch_warnings():
+        # all nan pools stay nan
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmax(pools, axis=2) if how == 'max' else np.nanmean(pools, axis=2)
+
+
+def align_tseries(values, index, tolerance, fillna=0):
+    '''Align time series to a common index, same as `pd.merge_asof(..., direction='nearest')`
+       of each series against the index but done for all of them at once.
+       Each index point takes the value of the nearest point of the series (the earlier one on a tie)
+       if it's no further than `tolerance`, otherwise `fillna`.
+
+    :param values: list of pandas series with tseries index
+    :param index: sorted DatetimeIndex to align to
+    :param tolerance: anything `pd.Timedelta` accepts
+    :returns: 2-D float array, a row per series and a column per index point
+    '''
+    grid = _nanoseconds(index)
+    n_rows, n_cols = len(values), len(grid)
+    tolerance = pd.Timedelta(tolerance).value
+
+    # all points of all series in a single array ordered by series and time
+    values = [ts if ts.index.is_monotonic_increasing else ts.sort_index(kind='stable') for ts in values]
+    starts = np.cumsum([0] + [len(ts) for ts in values])
+    times = np.concatenate([_nanoseconds(ts.index) for ts in values] or [[]]).astype('int64')
+    vals = np.concatenate([ts.to_numpy(dtype=float) for ts in values] or [[]])
+
+    # last point at or before each index point, the one after it is the first point past it
+    backward = np.empty((n_rows, n_cols), dtype='int64')
+    for i in range(n_rows):
+        backward[i] = np.searchsorted(times[starts[i]:starts[i+1]], grid, side='right')
+    backward += starts[:-1, np.newaxis] - 1
+    forward = backward + 1
+
+    # distances to both candidates, a missing one is infinitely far
+    # (out of range positions point to the padding or to other series)
+    times = np.append(times.astype(float), np.nan)
+    back_distance = np.where(backward >= starts[:-1, np.newaxis], grid - times[backward], np.inf)
+    fwd_distance = np.where(forward < starts[1:, np.newaxis], times[forward] - grid, np.inf)
+
+    use_backward = back_distance <= fwd_distance
+    nearest = np.where(use_backward, backward, forward)
+    distance = np.where(use_backward, back_distance, fwd_distance)
+
+    aligned = np.full((n_rows, n_cols), np.nan)
+    found = distance <= tolerance
+    aligned[found] = vals[nearest[found]]
+    aligned[np.isnan(aligned)] = fillna
+    return aligned
+
+
+def _nanoseconds(index):
+    return pd.DatetimeIndex(index).to_numpy(dtype='datetime64[ns]').view('int64')
+
+
 def stripes_for_tseries(values, width, freq, align_tolerance, fillna=0, **kw):
     '''A convenient wrapper around `stripes`. Creates appropriately sized figure.
        Assumes values are pandas series with tseries index. Aligns the tseries to an equal frequency.
@@ -118,17 +235,10 @@ def stripes_for_tseries(values, width, freq, align_tolerance, fillna=0, **kw):
     # align values
     # our tseries indexed values could have gaps, different length and frequency
     # so we align them to a uniform index, and fill gaps in the data to `fillna`
-    values_ = []
     xmin = min(ts.index[0] for ts in values)
     xmax = max(ts.index[-1] for ts in values)
     uniform_index = pd.date_range(xmin, xmax, freq=freq)
-    ref_df = pd.DataFrame(index=uniform_index)
-    for tseries in values:
-        # maybe I should've used resampler here instead
-        df = pd.merge_asof(ref_df, pd.DataFrame(tseries), left_index=True, right_index=True,
-                           tolerance=pd.Timedelta(align_tolerance), direction='nearest')
-        values_.append(df.iloc[:,0].fillna(fillna))
-    values = values_
+    values = align_tseries(values, uniform_index, align_tolerance, fillna=fillna)
 
     # stripes plot
     stripes(values, ax=main_ax, cax=cb_ax, xlim=(xmin, xmax), **kw)
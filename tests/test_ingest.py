@@ -0,0 +1,76 @@
+'''Incremental ingestion of a synthetic corpus (see `atop_bench.write_corpus`) into sqlite.'''
+import pytest
+
+from atop_bench import write_corpus
+from atop_reader import AtopStats, iterate_atop_records, to_sqlite, ingest_sqlite, hosts_to_sqlite
+
+
+TYPES = ['CPU', 'DSK', 'PRG', 'PRC']
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    files = write_corpus(str(tmp_path / 'corpus'), days=3, samples_per_day=6, processes=5, reboots_per_day=1)
+    return files, str(tmp_path / 'corpus' / 'atop')
+
+
+def rows(conn):
+    return {type_: conn.execute(f'SELECT * FROM {type_} ORDER BY sample_n, rowid').fetchall() for type_ in TYPES}
+
+
+def truncate(path, samples):
+    'Keep the first `samples` samples of a corpus log, return its original text.'
+    with open(path) as f:
+        text = f.read()
+    kept, seen = [], 0
+    for line in text.splitlines(keepends=True):
+        if line in ('RESET\n', 'SEP\n'):
+            seen += 1
+            if seen > samples:
+                break
+        kept.append(line)
+    with open(path, 'w') as f:
+        f.writelines(kept)
+    return text
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_ingest_sqlite_continues_where_it_stopped(tmp_path, corpus, workers):
+    files, binary = corpus
+    expected = rows(to_sqlite(str(tmp_path / 'full.db'), iterate_atop_records(files, TYPES, binary)))
+
+    # the last log is still being written on the first run
+    text = truncate(files[-1], 2)
+    ingested = []
+    conn = ingest_sqlite(str(tmp_path / 'atop.db'), files, TYPES, binary, workers=workers, progress=ingested.append)
+    conn.close()
+    assert ingested == [0, 1, 2]
+
+    # nothing changed
+    ingested = []
+    conn = ingest_sqlite(str(tmp_path / 'atop.db'), files, TYPES, binary, workers=workers, progress=ingested.append)
+    conn.close()
+    assert ingested == []
+
+    # the last log has grown, it is read from its last ingested sample on
+    with open(files[-1], 'w') as f:
+        f.write(text)
+    stats = AtopStats()
+    ingested = []
+    conn = ingest_sqlite(str(tmp_path / 'atop.db'), files, TYPES, binary, workers=workers, progress=ingested.append,
+                         stats=stats)
+    assert ingested == [2]
+    assert stats.counters['records.CPU'] == 6 - 2 + 1
+    assert rows(conn) == expected
+
+
+def test_hosts_to_sqlite(tmp_path, corpus):
+    files, binary = corpus
+    hosts = {'a': files, 'b': files[1:]}
+
+    conn = hosts_to_sqlite(str(tmp_path / 'fleet.db'), hosts, TYPES, binary, concurrency=2)
+    for host, host_files in hosts.items():
+        records = list(iterate_atop_records(host_files, TYPES, binary))
+        for type_ in TYPES:
+            rows = conn.execute(f'SELECT * FROM {type_} WHERE host = ? ORDER BY rowid', [host]).fetchall()
+            assert rows == [(*r[:6], host, *r[6:]) for r in records if r[0] == type_]
@@ -0,0 +1,65 @@
+'''Records and column batches of a synthetic corpus (see `atop_bench.write_corpus`).'''
+from collections import defaultdict
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import atop_reader
+from atop_bench import write_corpus
+from atop_reader import AtopStats, iterate_atop_records, iterate_atop_batches
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    files = write_corpus(str(tmp_path / 'corpus'), days=2, samples_per_day=4, processes=5, reboots_per_day=1)
+    return files, str(tmp_path / 'corpus' / 'atop')
+
+
+def records_by_type(records):
+    by_type = defaultdict(list)
+    for record in records:
+        by_type[record[0]].append(record)
+    return dict(by_type)
+
+
+@pytest.mark.parametrize('kw', [
+    {},
+    {'batch_size': 7},
+    {'record_types': ['CPU', 'PRG', 'DSK'], 'columns': {'PRG': ['TID', 'name', 'cmd'], 'CPU': []}},
+    {'processes_only': True, 'pids': [1, 2, 3]},
+])
+def test_batches_hold_the_records(corpus, kw):
+    files, binary = corpus
+    batch_size = kw.pop('batch_size', 10000)
+    expected = records_by_type(iterate_atop_records(files, binary=binary, **kw))
+
+    batches = list(iterate_atop_batches(files, binary=binary, batch_size=batch_size, **kw))
+    for _, columns in batches:
+        assert 0 < len(columns['type']) <= batch_size
+        assert len(set(columns['log_file'])) == 1
+
+    rows = defaultdict(list)
+    for type_, columns in batches:
+        rows[type_].extend(zip(*(values.tolist() for values in columns.values())))
+    assert dict(rows) == expected
+
+
+@pytest.mark.parametrize('kw', [{}, {'record_types': ['PRG', 'CPU'], 'columns': {'PRG': ['TID', 'cmd'], 'CPU': []}}])
+def test_workers_stream_the_sequential_records(monkeypatch, corpus, kw):
+    files, binary = corpus
+    sequential_stats = AtopStats()
+    expected = list(iterate_atop_records(files, binary=binary, stats=sequential_stats, **kw))
+
+    # one sample per chunk and a single chunk ahead, workers block on the queue most of the time
+    monkeypatch.setattr(atop_reader, '_PARALLEL_CHUNK_SAMPLES', 1)
+    monkeypatch.setattr(atop_reader, '_PARALLEL_CHUNKS', 1)
+    stats = AtopStats()
+    assert list(iterate_atop_records(files, binary=binary, workers=2, stats=stats, **kw)) == expected
+    assert stats.counters == sequential_stats.counters
+
+
+def test_worker_errors_are_raised(corpus):
+    files, _ = corpus
+    with pytest.raises(FileNotFoundError):
+        list(iterate_atop_records(files, binary='/nonexistent/atop', workers=2))
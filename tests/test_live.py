@@ -0,0 +1,79 @@
+'''Live sources against the fake atop of a synthetic corpus (see `atop_bench.write_corpus`).'''
+import os
+import threading
+from itertools import groupby
+from operator import itemgetter
+
+import pytest
+
+from atop_bench import generate_atop_lines, write_corpus
+from atop_reader import list_atop_logs, iterate_atop_records, iterate_live_records, follow_atop_records
+
+
+TYPES = ['CPU', 'PRG', 'PRC']
+START = 1508450400
+
+
+@pytest.fixture
+def binary(tmp_path):
+    write_corpus(str(tmp_path / 'corpus'), days=1, samples_per_day=6, processes=5)
+    return str(tmp_path / 'corpus' / 'atop')
+
+
+def by_sample(records):
+    return [list(sample) for _, sample in groupby(records, itemgetter(3))]
+
+
+@pytest.mark.parametrize('grouped', [False, True])
+def test_live_records(tmp_path, binary, grouped):
+    log = list_atop_logs(str(tmp_path / 'corpus'))[0]
+    expected = [(*r[:5], '-', *r[6:]) for r in iterate_atop_records([log], TYPES, binary) if r[3] < 4]
+
+    records = iterate_live_records(0.01, 4, TYPES, binary, by_sample=grouped, idle=0.5)
+    if grouped:
+        assert list(records) == by_sample(expected)
+    else:
+        assert list(records) == expected
+
+
+def write_samples(path, samples):
+    'Write a log holding given samples at once, so a reader never sees half of a line.'
+    with open(path + '.tmp', 'w') as f:
+        for sample in samples:
+            f.writelines(line + '\n' for line in sample)
+    os.replace(path + '.tmp', path)
+
+
+def split_samples(lines):
+    samples = []
+    for line in lines:
+        if line in ('RESET', 'SEP') and samples and len(samples[-1]) > 1:
+            samples.append([])
+        if not samples:
+            samples.append([])
+        samples[-1].append(line)
+    return samples
+
+
+def test_follow_records(tmp_path, binary):
+    logs = tmp_path / 'logs'
+    logs.mkdir()
+    first, second = str(logs / 'atop_20171020'), str(logs / 'atop_20171021')
+    # 2 samples per minute, only samples past the last read one are yielded after atop -b
+    day1 = split_samples(generate_atop_lines(10, START, 30, processes=5, reboots=[6], seed=1))
+    day2 = split_samples(generate_atop_lines(4, START + 86400, 30, processes=5, seed=2))
+
+    follow = follow_atop_records(root=str(logs), poll_interval=0.05, by_sample=True, record_types=TYPES,
+                                 binary=binary)
+    # nothing is there yet, the log appears while following
+    threading.Timer(0.2, write_samples, (first, day1[:3])).start()
+    got = [next(follow) for _ in range(3)]
+
+    write_samples(first, day1[:8])
+    got += [next(follow) for _ in range(5)]
+    write_samples(first, day1)
+    write_samples(second, day2)
+    got += [next(follow) for _ in range(6)]
+    follow.close()
+
+    assert got == by_sample(iterate_atop_records([first, second], TYPES, binary))
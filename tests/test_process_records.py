@@ -0,0 +1,109 @@
+'''Joining and splitting per process records of hand written samples.'''
+import random
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+import atop_reader
+from atop_reader import GENERIC_FIELDS, parse_atop_schema, merge_process_records, split_process_records, to_pandas
+
+
+SCHEMA = parse_atop_schema('''
+PRG - per process general information
+TID:int - TID
+name:str - name
+
+PRC - per process CPU utilization
+TID:int - TID
+cpu_usr:int:ticks - CPU-consumption in user mode
+
+PRM - per process memory occupation
+TID:int - TID
+mem_res_size:int - resident memory size
+
+CPL - CPU load information
+load_avg1:float - load average for last minute
+''')
+
+
+def interleaved_records(samples=6, tids=8, seed=0):
+    'Records of samples with types mixed up within a sample and some processes missing a type.'
+
+    rnd = random.Random(seed)
+    records = []
+    for sample_n in range(samples):
+        generic = (1000 + sample_n * 10, 10, sample_n, 0, 'atop_20171020')
+        sample = [('CPL', *generic, rnd.random())]
+        for tid in rnd.sample(range(tids), tids):
+            if rnd.random() < .8:
+                sample.append(('PRG', *generic, tid, f'p{tid}'))
+            if rnd.random() < .8:
+                sample.append(('PRC', *generic, tid, rnd.randrange(100)))
+            if rnd.random() < .8:
+                sample.append(('PRM', *generic, tid, rnd.randrange(100)))
+        rnd.shuffle(sample)
+        records.extend(sample)
+    return records
+
+
+def test_merged_processes_are_a_join_on_sample_and_tid():
+    records = interleaved_records()
+
+    frames = {type_: pd.DataFrame([r for r in records if r[0] == type_],
+                                  columns=[*GENERIC_FIELDS, *[f[0] for f in SCHEMA[type_]['fields']]])
+              for type_ in ('PRG', 'PRC', 'PRM')}
+    expected = frames['PRG'].assign(type='PS')
+    for type_ in ('PRC', 'PRM'):
+        fields = frames[type_].drop(columns=['type', 'epoch', 'sample_interval', 'boot_n', 'log_file'])
+        expected = expected.merge(fields, on=['sample_n', 'TID'])
+
+    merged = list(merge_process_records(records, ('PRG', 'PRC', 'PRM'), SCHEMA))
+    assert [r for r in merged if r[0] == 'PS'] == list(expected.itertuples(index=False, name=None))
+    assert len(expected) < len(frames['PRG'])
+
+    # other records pass through, processes of a sample follow them and precede the next sample
+    assert [r for r in merged if r[0] != 'PS'] == [r for r in records if r[0] == 'CPL']
+    order = [(r[3], r[0] == 'PS') for r in merged]
+    assert order == sorted(order)
+
+
+PRG_SCHEMA = parse_atop_schema('''
+PRG - per process general information
+TID:int - TID
+name:str - name
+start_epoch:int - start time (epoch)
+cmd:str - full command line
+PPID:int - PPID
+''')
+
+
+def test_exec_and_setproctitle_start_another_process():
+    prg = [
+        # the shell of TID 10 execs a daemon which then renames its command line, its parent dies
+        (0, 0, 10, 'sh', 900, 'sh -c mydaemon', 1),
+        (1, 0, 10, 'mydaemon', 900, 'mydaemon', 1),
+        (2, 0, 10, 'mydaemon', 900, 'mydaemon: idle', 5),
+        (3, 0, 10, 'mydaemon', 900, 'mydaemon: idle', 1),
+        # the same TID after a reboot is another process
+        (4, 1, 10, 'mydaemon', 900, 'mydaemon: idle', 1),
+    ]
+    records = [('PRG', 1000 + s * 10, 10, s, boot_n, 'atop_20171020', *fields) for s, boot_n, *fields in prg]
+
+    split = list(split_process_records(records, PRG_SCHEMA))
+    # sample_n, boot_n, process_id, TID, start_epoch, name, cmd
+    assert [(r[3], r[4], *r[6:]) for r in split if r[0] == 'PROCESS'] == [
+        (0, 0, 0, 10, 900, 'sh', 'sh -c mydaemon'),
+        (1, 0, 1, 10, 900, 'mydaemon', 'mydaemon'),
+        (2, 0, 2, 10, 900, 'mydaemon', 'mydaemon: idle'),
+        (4, 1, 3, 10, 900, 'mydaemon', 'mydaemon: idle'),
+    ]
+    # process_id, TID, PPID
+    assert [r[6:] for r in split if r[0] == 'PRG'] == [(0, 10, 1), (1, 10, 1), (2, 10, 5), (2, 10, 1), (3, 10, 1)]
+
+    # the same with column batches
+    batches = atop_reader._records_to_batches(records, PRG_SCHEMA)
+    frames = to_pandas(batches, schema=PRG_SCHEMA, split_processes=True)
+    expected = to_pandas(split, schema=atop_reader.split_process_schema(PRG_SCHEMA))
+    for type_ in ('PROCESS', 'PRG'):
+        pd.testing.assert_frame_equal(frames[type_], expected[type_], check_dtype=False)
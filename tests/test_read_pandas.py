@@ -0,0 +1,66 @@
+'''read_pandas with its parquet cache over a synthetic corpus (see `atop_bench.write_corpus`).'''
+import os
+import json
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from atop_bench import write_corpus
+from atop_reader import read_pandas
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    files = write_corpus(str(tmp_path / 'corpus'), days=2, samples_per_day=4, processes=5, reboots_per_day=1)
+    return files, str(tmp_path / 'corpus' / 'atop')
+
+
+def assert_same_frames(frames, expected):
+    for type_, df in expected.items():
+        pd.testing.assert_frame_equal(frames[type_], df)
+
+
+def test_lazy_workers_fill_a_fresh_cache(tmp_path, corpus):
+    files, binary = corpus
+    cache_dir = str(tmp_path / 'cache')
+    expected = read_pandas(files, binary=binary)
+
+    # every worker adds its record types to the same cache entries
+    frames = read_pandas(files, binary=binary, cache_dir=cache_dir, lazy=True, workers=4).load()
+    assert not frames.pending
+    assert_same_frames(frames, expected)
+
+    labels = set()
+    for name in os.listdir(cache_dir):
+        if os.path.isdir(os.path.join(cache_dir, name)):
+            with open(os.path.join(cache_dir, name, 'meta.json')) as f:
+                labels.add(tuple(json.load(f)['labels']))
+    assert len(labels) == 1 and {'CPU', 'PRG', 'NET', 'cpu'} <= set(*labels)
+
+    # served from the cache, atop is not run
+    frames = read_pandas(files, ['CPU', 'PRG', 'NET'], binary='false', cache_dir=cache_dir)
+    assert sorted(frames) == ['CPU', 'NET', 'NET_IF', 'PRG']
+    assert_same_frames(frames, {t: expected[t] for t in frames})
+
+
+def test_lazy_contains_does_not_read(corpus):
+    files, binary = corpus
+    frames = read_pandas(files, binary=binary, lazy=True)
+    assert 'CPU' in frames and 'FOO' not in frames
+    assert 'CPU' in frames.pending
+    pd.testing.assert_frame_equal(frames['CPU'], read_pandas(files, ['CPU'], binary=binary)['CPU'])
+    assert 'CPU' not in frames.pending
+
+
+def test_interrupted_fill_is_redone(tmp_path, corpus):
+    files, binary = corpus
+    cache_dir = str(tmp_path / 'cache')
+    expected = read_pandas(files, ['PRC'], binary=binary, cache_dir=cache_dir)
+
+    for name in os.listdir(cache_dir):
+        if os.path.isdir(os.path.join(cache_dir, name)):
+            os.remove(os.path.join(cache_dir, name, 'meta.json'))
+
+    assert_same_frames(read_pandas(files, ['PRC'], binary=binary, cache_dir=cache_dir), expected)
@@ -0,0 +1,72 @@
+'''Rollups of hand written frames and of a synthetic corpus (see `atop_bench.write_corpus`).'''
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from atop_bench import write_corpus
+from atop_reader import iterate_atop_records, to_pandas, ingest_sqlite, rollup_frames
+
+
+def test_rollups_of_gauges_and_counters():
+    frames = {
+        'PRM': pd.DataFrame({
+            'epoch': [0, 0, 0, 30, 60],
+            'name': ['a', 'a', 'b', 'a', 'a'],
+            'TID': [10, 11, 20, 10, 10],
+            'is_process': [True, False, True, True, True],
+            'page_size': [4096] * 5,
+            'mem_res_size': [100, 100, 50, 300, 1000],
+            'pagefaults_minor': [1, 1, 5, 3, 7],
+        }),
+        'CPL': pd.DataFrame({
+            'epoch': [0, 30, 60],
+            'processors': [4, 4, 4],
+            'load_avg1': [1., 3., 2.],
+            'ctx_switches': [10, 20, 5],
+        }),
+    }
+
+    rollups = rollup_frames(frames, ['1m'])
+
+    # the thread of process a is left out, TID and page_size aren't aggregated
+    pd.testing.assert_frame_equal(rollups['PRM_1m'], pd.DataFrame({
+        'bucket': [0, 0, 60],
+        'name': ['a', 'b', 'a'],
+        'rows': [2, 1, 1],
+        'mem_res_size_mean': [200., 50., 1000.],
+        'mem_res_size_max': [300, 50, 1000],
+        'mem_res_size_p95': [290., 50., 1000.],
+        'pagefaults_minor_sum': [4, 5, 7],
+        'pagefaults_minor_mean': [2., 5., 7.],
+        'pagefaults_minor_max': [3, 5, 7],
+        'pagefaults_minor_p95': [2.9, 5., 7.],
+    }))
+    pd.testing.assert_frame_equal(rollups['CPL_1m'], pd.DataFrame({
+        'bucket': [0, 60],
+        'rows': [2, 1],
+        'load_avg1_mean': [2., 2.],
+        'load_avg1_max': [3., 2.],
+        'load_avg1_p95': [2.9, 2.],
+        'ctx_switches_sum': [30, 5],
+        'ctx_switches_mean': [15., 5.],
+        'ctx_switches_max': [20, 5],
+        'ctx_switches_p95': [19.5, 5.],
+    }))
+
+
+def test_sqlite_rollups_are_merged_as_pandas_ones(tmp_path):
+    files = write_corpus(str(tmp_path / 'corpus'), days=2, samples_per_day=12, processes=5)
+    binary = str(tmp_path / 'corpus' / 'atop')
+    types = ['CPL', 'MEM', 'DSK', 'PRM']
+    resolutions = ['7h', '1d']
+    expected = rollup_frames(to_pandas(iterate_atop_records(files, types, binary)), resolutions)
+
+    # the second file adds records into the last bucket of the first one
+    ingest_sqlite(str(tmp_path / 'atop.db'), files[:1], types, binary, rollups=resolutions).close()
+    conn = ingest_sqlite(str(tmp_path / 'atop.db'), files, types, binary, rollups=resolutions)
+
+    assert expected.keys() == {f'{t}_{r}' for t in types for r in resolutions}
+    for name, df in expected.items():
+        keys = [c for c in ('bucket', 'name') if c in df]
+        rollup = pd.read_sql(f'SELECT * FROM {name}', conn).sort_values(keys, ignore_index=True)
+        pd.testing.assert_frame_equal(rollup, df, check_dtype=False)